@@ -0,0 +1,198 @@
+"""
+Byte and n-gram statistics behind /counteach.
+"""
+import csv
+import io
+
+import numpy as np
+
+from scoring import letter_counts, to_bytes
+
+
+def to_array(data):
+    return np.frombuffer(to_bytes(data), dtype=np.uint8)
+
+
+def entropy_of_counts(counts):
+    total = counts.sum()
+    if not total:
+        return 0.0
+    probs = counts[counts > 0] / total
+    # + 0.0 turns -0.0 of a single repeated byte into 0.0
+    return float(-(probs * np.log2(probs)).sum()) + 0.0
+
+
+def entropy(data):
+    """
+    Shannon entropy of `data` in bits per byte.
+    """
+    return entropy_of_counts(np.bincount(to_array(data), minlength=256))
+
+
+def ioc_of_counts(counts):
+    counts = counts.astype(np.float64)
+    total = counts.sum()
+    if total < 2:
+        return 0.0
+    return float((counts * (counts - 1)).sum() / (total * (total - 1)))
+
+
+def index_of_coincidence(data):
+    """
+    Chance that two letters picked from `data` are the same, case folded.
+    English is around 0.067, uniformly random letters 0.038.
+    """
+    return ioc_of_counts(letter_counts(data))
+
+
+def ngram_codes(arr, n):
+    """
+    Every n-gram of `arr` packed into one integer, first byte highest.
+    """
+    size = max(len(arr) - n + 1, 0)
+    codes = np.zeros(size, dtype=np.uint32)
+    for i in range(n):
+        codes = (codes << 8) | arr[i : i + size]
+    return codes
+
+
+def most_common(grams, counts, n, top=None):
+    """
+    The `top` n-grams with the highest counts as (bytes, count).
+    """
+    order = np.argsort(-counts, kind="stable")[:top]
+    return [
+        (int(gram).to_bytes(n, "big"), int(count))
+        for gram, count in zip(grams[order], counts[order])
+    ]
+
+
+def ngrams(data, n, top=None):
+    """
+    The `top` most common n-grams of `data` as (bytes, count), most common first.
+    """
+    counter = NgramCounter()
+    counter.feed(data)
+    return counter.ngrams(n, top)
+
+
+class NgramCounter:
+    """
+    Byte, bigram and trigram counts of a stream fed in chunks. The last two
+    bytes of a chunk are kept so n-grams across chunks count as well.
+    Unigrams and bigrams go into fixed bincounts. 256**3 trigram bins would
+    be 128 MiB, so trigrams are kept as sorted (code, count) arrays merged
+    every `merge_every` codes, holding at most `max_trigrams` of them. Past
+    that the rarest are dropped, which only happens on high entropy input
+    where trigram ranks say nothing anyway.
+    """
+
+    def __init__(self, *, merge_every=1_000_000, max_trigrams=1_000_000):
+        self.merge_every = merge_every
+        self.max_trigrams = max_trigrams
+        self.length = 0
+        self.unigrams = np.zeros(256, dtype=np.int64)
+        self.bigrams = np.zeros(256**2, dtype=np.int64)
+        self.trigrams = np.zeros(0, dtype=np.uint32)
+        self.trigram_counts = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._pending_size = 0
+        self._tail = np.zeros(0, dtype=np.uint8)
+
+    def feed(self, data):
+        arr = to_array(data)
+        if not len(arr):
+            return
+        self.length += len(arr)
+        self.unigrams += np.bincount(arr, minlength=256)
+
+        # n-grams lying entirely in the carried over tail were counted already
+        window = np.concatenate((self._tail, arr))
+        carried = len(self._tail)
+        self.bigrams += np.bincount(
+            ngram_codes(window[max(carried - 1, 0) :], 2), minlength=256**2
+        )
+        codes = ngram_codes(window[max(carried - 2, 0) :], 3)
+        self._pending.append(codes)
+        self._pending_size += len(codes)
+        if self._pending_size >= self.merge_every:
+            self._merge()
+        self._tail = window[-2:].copy()
+
+    def _merge(self):
+        codes = np.concatenate([self.trigrams, *self._pending])
+        weights = np.concatenate(
+            [self.trigram_counts, *(np.ones(len(p), dtype=np.int64) for p in self._pending)]
+        )
+        self._pending = []
+        self._pending_size = 0
+        grams, inverse = np.unique(codes, return_inverse=True)
+        counts = np.bincount(inverse, weights=weights).astype(np.int64)
+        if len(grams) > self.max_trigrams:
+            keep = np.sort(np.argpartition(-counts, self.max_trigrams)[: self.max_trigrams])
+            grams, counts = grams[keep], counts[keep]
+        self.trigrams, self.trigram_counts = grams, counts
+
+    def ngrams(self, n, top=None):
+        if n == 3:
+            self._merge()
+            return most_common(self.trigrams, self.trigram_counts, 3, top)
+        counts = self.unigrams if n == 1 else self.bigrams
+        grams = np.flatnonzero(counts)
+        return most_common(grams, counts[grams], n, top)
+
+    def stats(self, top=10):
+        letters = self.unigrams[ord("a") : ord("z") + 1] + self.unigrams[ord("A") : ord("Z") + 1]
+        return {
+            "length": self.length,
+            "entropy": entropy_of_counts(self.unigrams),
+            "ioc": ioc_of_counts(letters),
+            "ngrams": {n: self.ngrams(n, top) for n in (1, 2, 3)},
+        }
+
+
+def analyze(data, top=10):
+    counter = NgramCounter()
+    counter.feed(data)
+    return counter.stats(top)
+
+
+def show(gram):
+    return repr(gram)[1:]
+
+
+def table(stats):
+    """
+    The statistics as a fixed width table of the n-grams side by side.
+    """
+    total = {n: max(stats["length"] - n + 1, 1) for n in (1, 2, 3)}
+    lines = [
+        f"{stats['length']} bytes, entropy {stats['entropy']:.3f} bits/byte, "
+        f"IoC {stats['ioc']:.4f}",
+        "",
+        "  ".join(f"{f'{n}-gram':<14}{'count':>9}{'%':>7}" for n in (1, 2, 3)),
+    ]
+    rows = max(len(grams) for grams in stats["ngrams"].values())
+    for i in range(rows):
+        cells = []
+        for n, grams in stats["ngrams"].items():
+            if i < len(grams):
+                gram, count = grams[i]
+                cells.append(f"{show(gram):<14}{count:>9}{100 * count / total[n]:>7.2f}")
+            else:
+                cells.append(" " * 30)
+        lines.append("  ".join(cells).rstrip())
+    return "\n".join(lines)
+
+
+def to_csv(stats):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["n", "ngram", "hex", "count", "percent"])
+    for n, grams in stats["ngrams"].items():
+        total = max(stats["length"] - n + 1, 1)
+        for gram, count in grams:
+            writer.writerow(
+                [n, gram.decode("latin-1"), gram.hex(), count, f"{100 * count / total:.4f}"]
+            )
+    return out.getvalue()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import Counter
+
+
+class AudioCache:
+    """
+    Size bounded directory of Opus files of frequently played tracks.
+    A track is downloaded (once, however many guilds play it) after it has
+    been played `min_plays` times. Files are written under a temporary name
+    and renamed into place, and the least recently played files are removed
+    when the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory, *, min_plays=3, max_bytes=2 * 1024**3, bitrate="128k"):
+        self.directory = directory
+        self.min_plays = min_plays
+        self.max_bytes = max_bytes
+        self.bitrate = bitrate
+        self.plays = Counter()
+        self._downloads = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.opus")
+
+    def get(self, track):
+        """
+        A copy of `track` that plays from the local file, or None if the
+        track isn't cached.
+        """
+        video_id = track.get("id")
+        if not video_id:
+            return None
+        path = self.path(video_id)
+        try:
+            # mtime doubles as the last played time for eviction
+            os.utime(path)
+        except OSError:
+            return None
+        return {**track, "stream_url": path, "acodec": "opus", "ext": "opus"}
+
+    def record_play(self, track):
+        video_id = track.get("id")
+        if not video_id:
+            return
+        self.plays[video_id] += 1
+        if (
+            self.plays[video_id] >= self.min_plays
+            and track.get("stream_url")
+            and video_id not in self._downloads
+            and not os.path.exists(self.path(video_id))
+        ):
+            task = asyncio.create_task(self.download(track))
+            self._downloads[video_id] = task
+            task.add_done_callback(lambda _: self._downloads.pop(video_id, None))
+
+    async def download(self, track):
+        path = self.path(track["id"])
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        if track.get("acodec") == "opus":
+            codec = ["-c:a", "copy"]
+        else:
+            codec = ["-c:a", "libopus", "-b:a", self.bitrate]
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-loglevel", "error",
+            "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5",
+            "-i", track["stream_url"], "-vn", *codec, "-f", "opus", tmp_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await process.communicate()
+            if process.returncode != 0:
+                logging.error(f"Caching {track['id']} failed: {stderr.decode(errors='ignore')}")
+                return
+            os.replace(tmp_path, path)
+        except asyncio.CancelledError:
+            process.kill()
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        await asyncio.to_thread(self.evict)
+
+    def evict(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".opus"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                logging.exception("Exception occurred")
+
+    def stats(self):
+        files = [
+            entry.stat().st_size for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(".opus")
+        ]
+        return {"files": len(files), "bytes": sum(files), "downloading": len(self._downloads)}
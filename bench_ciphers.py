@@ -0,0 +1,63 @@
+"""
+Micro-benchmark of the table driven ciphers against the old per character
+implementation on 1 MB of text.
+Usage: python bench_ciphers.py
+"""
+import random
+import string
+import timeit
+
+from ciphers import Caesar, Rot47
+
+
+def caesar_loop(msg, key):
+    out = ""
+    for char in msg:
+        try:
+            shift = (string.ascii_lowercase.index(char.lower()) + key) % 26
+            out += (
+                string.ascii_lowercase[shift]
+                if char.islower()
+                else string.ascii_lowercase[shift].upper()
+            )
+        except ValueError:
+            out += char
+    return out
+
+
+def rot47_loop(msg):
+    out = ""
+    for char in msg:
+        try:
+            shift = (Rot47.rot47_charset.index(char) + 47) % 94
+            out += Rot47.rot47_charset[shift]
+        except ValueError:
+            out += char
+    return out
+
+
+def bench(name, old, new, number=3):
+    assert old() == new(), name
+    old_time = min(timeit.repeat(old, number=1, repeat=number))
+    new_time = min(timeit.repeat(new, number=1, repeat=number))
+    print(f"{name:<20} loop {old_time * 1000:9.1f} ms   table {new_time * 1000:7.2f} ms   {old_time / new_time:7.0f}x")
+
+
+def main():
+    random.seed(0)
+    text = "".join(random.choices(string.printable, k=1024 * 1024))
+    data = text.encode()
+
+    bench("caesar str", lambda: caesar_loop(text, 3), lambda: Caesar.encrypt(text, 3))
+    bench("caesar bytes", lambda: caesar_loop(text, 3).encode(), lambda: Caesar.encrypt(data, 3))
+    bench("rot47 str", lambda: rot47_loop(text), lambda: Rot47.encrypt(text))
+    bench(
+        "/rot (25 shifts)",
+        lambda: [caesar_loop(text, -i) for i in range(1, 26)],
+        lambda: [Caesar.decrypt(text, i) for i in range(1, 26)],
+        number=1,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Conversions between bytes and text bits or number lists, with NumPy doing
+the per byte work so megabyte inputs take milliseconds.
+"""
+import numpy as np
+
+bases = {2: "b", 8: "o", 10: "d", 16: "x"}
+
+# Whitespace separates bit groups, number lists may use commas as well
+whitespace = np.zeros(256, dtype=bool)
+whitespace[list(b" \t\n\r\x0b\x0c")] = True
+separators = whitespace.copy()
+separators[ord(",")] = True
+
+
+def to_array(data):
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def groups(arr, is_separator):
+    """
+    The characters of `arr` that aren't separators and the length of every
+    group they form.
+    """
+    inside = ~is_separator[arr]
+    if inside.all():
+        return arr, np.array([len(arr)] if len(arr) else [], dtype=np.int64)
+    edges = np.diff(inside.view(np.int8), prepend=0, append=0)
+    lengths = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return arr[inside], lengths
+
+
+def encode(data, width=8):
+    """
+    The bits of every byte of `data` as ASCII 0s and 1s, `width` (7 or 8)
+    bits per byte.
+    """
+    bits = np.unpackbits(to_array(data)).reshape(-1, 8)
+    if width == 7:
+        if bits[:, 0].any():
+            raise ValueError("Only ASCII fits in 7 bits")
+        bits = bits[:, 1:]
+    elif width != 8:
+        raise ValueError("Width has to be 7 or 8")
+    return (bits.ravel() + ord("0")).tobytes()
+
+
+def decode(data, width=8):
+    """
+    Bytes from ASCII bits, `width` (7 or 8) bits per byte.
+    Whitespace separates groups, a group that isn't a whole number of bytes
+    is padded with leading zeros.
+    """
+    if width not in (7, 8):
+        raise ValueError("Width has to be 7 or 8")
+    bits, lengths = groups(to_array(data), whitespace)
+    bits = bits - ord("0")
+    if (bits > 1).any():
+        raise ValueError("Only 0, 1 and whitespace can be decoded")
+
+    padding = -lengths % width
+    if padding.any():
+        group_starts = np.cumsum(lengths) - lengths
+        bits = np.insert(bits, np.repeat(group_starts, padding), 0)
+    bits = bits.reshape(-1, width)
+    if width == 7:
+        bits = np.pad(bits, ((0, 0), (1, 0)))
+    return np.packbits(bits).tobytes()
+
+
+def encode_numbers(data, base=10):
+    """
+    `data` as a space separated list of byte values in `base` (2, 8, 10 or 16).
+    """
+    table = [format(i, bases[base]).encode() + b" " for i in range(256)]
+    flat = to_array(b"".join(table))
+    sizes = np.array([len(value) for value in table])
+    offsets = np.cumsum(sizes) - sizes
+
+    arr = to_array(data)
+    out_sizes = sizes[arr]
+    out_starts = np.cumsum(out_sizes) - out_sizes
+    # Index into `flat` for every output character
+    index = np.repeat(offsets[arr] - out_starts, out_sizes) + np.arange(out_sizes.sum())
+    return flat[index][:-1].tobytes()
+
+
+def decode_numbers(data, base=10):
+    """
+    Bytes from a whitespace or comma separated list of byte values in `base`.
+    """
+    chars, lengths = groups(to_array(data), separators)
+    ids = np.repeat(np.arange(len(lengths)), lengths)
+    digits = chars.astype(np.int64) - ord("0")
+    if base == 16:
+        lower = chars | 0x20
+        letters = (lower >= ord("a")) & (lower <= ord("f"))
+        digits[letters] = lower[letters] - ord("a") + 10
+    if ((digits < 0) | (digits >= base)).any():
+        raise ValueError(f"Only base {base} digits and separators can be decoded")
+    if lengths.size and lengths.max() > 9:
+        raise ValueError("Byte values go up to 255")
+
+    group_ends = np.cumsum(lengths)
+    place = group_ends[ids] - 1 - np.arange(len(digits))
+    values = np.bincount(ids, weights=digits * base**place, minlength=len(lengths))
+    if (values > 255).any():
+        raise ValueError("Byte values go up to 255")
+    return values.astype(np.uint8).tobytes()
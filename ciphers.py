@@ -0,0 +1,59 @@
+import string
+
+lowercase = string.ascii_lowercase
+uppercase = string.ascii_uppercase
+rot47_charset = "".join(chr(i) for i in range(33, 127))
+
+
+def _rotated(charset, key):
+    return charset[key:] + charset[:key]
+
+
+class Caesar:
+    caesar_charset = lowercase
+
+    # One translation table per shift, for str and for bytes input
+    str_tables = [
+        str.maketrans(lowercase + uppercase, _rotated(lowercase, k) + _rotated(uppercase, k))
+        for k in range(26)
+    ]
+    bytes_tables = [
+        bytes.maketrans(
+            (lowercase + uppercase).encode(),
+            (_rotated(lowercase, k) + _rotated(uppercase, k)).encode(),
+        )
+        for k in range(26)
+    ]
+
+    @staticmethod
+    def encrypt(msg, key: int):
+        if isinstance(msg, (bytes, bytearray)):
+            return msg.translate(Caesar.bytes_tables[key % 26])
+        return msg.translate(Caesar.str_tables[key % 26])
+
+    @staticmethod
+    def decrypt(msg, key: int):
+        return Caesar.encrypt(msg, -key)
+
+
+class Rot13:
+    @staticmethod
+    def encrypt(msg):
+        return Caesar.encrypt(msg, 13)
+
+
+class Rot47:
+    rot47_charset = rot47_charset
+    str_table = str.maketrans(rot47_charset, _rotated(rot47_charset, 47))
+    bytes_table = bytes.maketrans(rot47_charset.encode(), _rotated(rot47_charset, 47).encode())
+
+    @staticmethod
+    def encrypt(msg):
+        if isinstance(msg, (bytes, bytearray)):
+            return msg.translate(Rot47.bytes_table)
+        return msg.translate(Rot47.str_table)
+
+    @staticmethod
+    def decrypt(msg):
+        # Shifting by 47 of 94 characters is its own inverse
+        return Rot47.encrypt(msg)
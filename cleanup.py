@@ -0,0 +1,116 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from collections import defaultdict
+
+import discord
+
+from storage import load_json, save_json
+
+# Discord refuses to bulk delete messages older than 14 days
+bulk_delete_max_age = 14 * 24 * 3600 - 60
+
+
+class DeletionScheduler:
+    """
+    Deletes messages once their deadline passes, from a single task.
+    Pending deletions live in a min-heap keyed on the deadline, which is
+    rounded up to `granularity` seconds so messages sent around the same
+    time come due together and go out as one bulk delete per channel.
+    The heap is saved to `path` so a restart still cleans up.
+    """
+
+    def __init__(self, bot, path, *, granularity=10, save_interval=30):
+        self.bot = bot
+        self.path = path
+        self.granularity = granularity
+        self.save_interval = save_interval
+
+        self.heap = [tuple(item) for item in load_json(path, [])]
+        heapq.heapify(self.heap)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, message, delay):
+        deadline = math.ceil((time.time() + delay) / self.granularity) * self.granularity
+        item = (deadline, message.channel.id, message.id)
+        heapq.heappush(self.heap, item)
+        self._dirty = True
+        if self.heap[0] == item:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.save()
+
+    def save(self):
+        if self._dirty:
+            save_json(self.path, self.heap)
+            self._dirty = False
+        self._saved_at = time.monotonic()
+
+    async def _run(self):
+        while True:
+            timeout = self.save_interval
+            if self.heap:
+                timeout = min(timeout, max(0, self.heap[0][0] - time.time()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            due = defaultdict(list)
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                _, channel_id, message_id = heapq.heappop(self.heap)
+                due[channel_id].append(message_id)
+                self._dirty = True
+
+            for channel_id, message_ids in due.items():
+                try:
+                    await self._delete(channel_id, message_ids)
+                except Exception:
+                    logging.exception("Exception occurred")
+
+            if time.monotonic() - self._saved_at >= self.save_interval or due:
+                self.save()
+
+    async def _delete(self, channel_id, message_ids):
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            channel = self.bot.get_partial_messageable(channel_id)
+
+        now = time.time()
+        bulk = [
+            message_id for message_id in message_ids
+            if now - discord.utils.snowflake_time(message_id).timestamp() < bulk_delete_max_age
+        ]
+        if len(bulk) > 1 and hasattr(channel, "delete_messages"):
+            try:
+                for i in range(0, len(bulk), 100):
+                    await channel.delete_messages(
+                        [discord.Object(id=message_id) for message_id in bulk[i : i + 100]]
+                    )
+                message_ids = [m for m in message_ids if m not in set(bulk)]
+            except (discord.Forbidden, discord.HTTPException):
+                # Missing Manage Messages, fall back to deleting one by one
+                pass
+
+        for message_id in message_ids:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except (discord.NotFound, discord.Forbidden):
+                pass
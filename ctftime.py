@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+
+
+class EventsCache:
+    """
+    In memory cache of the upcoming ctftime events.
+    The biggest window the bot ever shows is fetched once and every `num` is
+    served from it. Entries are refreshed in the background a bit before they
+    expire, and the old list keeps being served while ctftime is down.
+    """
+
+    def __init__(self, http_client, url, *, window=15, ttl=3600, refresh_margin=300):
+        self.http_client = http_client
+        self.url = url
+        self.window = window
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+
+        self.events = None
+        self.fetched_at = 0
+        self.etag = None
+        self.last_modified = None
+        self._refresh_task = None
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    async def get(self, num=2):
+        if self.events is None or self.age >= self.ttl:
+            # Nothing usable yet, wait for the fetch (stale data is kept on errors)
+            await self.refresh_soon()
+        elif self.age >= self.ttl - self.refresh_margin:
+            self.refresh_soon()
+        return self.events[:num]
+
+    def refresh_soon(self):
+        """
+        Start a background refresh unless one is already running.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self._refresh_task
+
+    async def refresh(self):
+        request_headers = {}
+        if self.events is not None:
+            if self.etag:
+                request_headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                request_headers["If-Modified-Since"] = self.last_modified
+
+        try:
+            res = await self.http_client.get(
+                self.url, params={"limit": self.window}, headers=request_headers
+            )
+        except Exception:
+            if self.events is None:
+                raise
+            logging.exception("Refreshing ctftime events failed, serving stale data")
+            # Keep answering from the stale list and retry in the background
+            self.fetched_at = time.monotonic() - self.ttl + self.refresh_margin
+            return
+
+        if res.status != 304:
+            self.events = res.data
+            self.etag = res.headers.get("ETag")
+            self.last_modified = res.headers.get("Last-Modified")
+        self.fetched_at = time.monotonic()
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+from mysql.connector import pooling
+
+
+class Database:
+    """
+    Bounded pool of MySQL connections used from coroutines.
+    Queries run on a thread pool with one worker per connection, so the pool
+    never runs dry and the event loop never blocks. Connections are pinged
+    (and reconnected) before use and a query that hits a dropped connection
+    is retried once on a fresh one.
+    """
+
+    def __init__(self, *, pool_size=4, query_timeout=30, **connect_args):
+        self.pool_size = pool_size
+        self.query_timeout = query_timeout
+        self.connect_args = {"connection_timeout": query_timeout, **connect_args}
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="mysql"
+        )
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        # Connecting is slow, so it's done lazily from a worker thread
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name="bot", pool_size=self.pool_size, **self.connect_args
+                )
+            return self._pool
+
+    def _connection(self):
+        connection = self.pool.get_connection()
+        try:
+            connection.ping(reconnect=True, attempts=2, delay=1)
+        except mysql.connector.Error:
+            self._release(connection, broken=True)
+            raise
+        return connection
+
+    def _release(self, connection, broken=False):
+        """
+        Hand `connection` back to the pool. A broken one is disconnected
+        first, the pool reconnects it the next time it's handed out.
+        """
+        try:
+            if broken:
+                connection.disconnect()
+            connection.close()
+        except mysql.connector.Error:
+            # Resetting the session of a dead connection fails, it's back
+            # in the pool regardless
+            pass
+
+    def _fetchall(self, query, params, retry=True):
+        connection = self._connection()
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        except (mysql.connector.OperationalError, mysql.connector.InterfaceError):
+            # Give the broken connection back before asking for another one,
+            # with every worker retrying at once the pool has none to spare
+            self._release(connection, broken=True)
+            connection = None
+            if not retry:
+                raise
+            logging.info("Database connection dropped, retrying on a new one")
+            return self._fetchall(query, params, retry=False)
+        finally:
+            if connection is not None:
+                self._release(connection)
+
+    async def fetchall(self, query, params=(), *, timeout=None):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.executor, self._fetchall, query, params),
+            timeout=timeout or self.query_timeout,
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self._pool_lock:
+            if self._pool is not None:
+                # Only the idle connections, a query still running keeps its own
+                self._pool._remove_connections()
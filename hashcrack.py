@@ -0,0 +1,209 @@
+"""
+Hash identification and wordlist cracking behind /hash.
+"""
+import asyncio
+import hashlib
+import mmap
+import os
+import re
+import time
+from collections import namedtuple
+
+from storage import load_json, save_json
+from workers import process_pool
+
+hex_re = re.compile(r"^[0-9a-f]+$")
+
+# Hex digest length -> algorithms that produce it, most common first
+hex_lengths = {
+    32: ["md5"],
+    40: ["sha1", "ripemd160"],
+    56: ["sha224", "sha3_224", "sha512_224"],
+    64: ["sha256", "sha3_256", "blake2s", "sha512_256"],
+    96: ["sha384", "sha3_384"],
+    128: ["sha512", "sha3_512", "blake2b"],
+}
+
+# Salted formats that can be named but not cracked here
+crypt_prefixes = {
+    "$1$": "md5crypt",
+    "$2a$": "bcrypt",
+    "$2b$": "bcrypt",
+    "$2y$": "bcrypt",
+    "$5$": "sha256crypt",
+    "$6$": "sha512crypt",
+    "$argon2": "argon2",
+    "$apr1$": "apache md5",
+}
+
+Result = namedtuple("Result", ["word", "algorithm", "offset", "size", "reason"])
+
+
+def identify(digest):
+    """
+    The algorithms `digest` could come from and whether they can be cracked.
+    """
+    digest = digest.strip()
+    for prefix, name in crypt_prefixes.items():
+        if digest.startswith(prefix):
+            return [name], False
+    digest = digest.lower()
+    if not hex_re.match(digest):
+        return [], False
+    names = [
+        name
+        for name in hex_lengths.get(len(digest), [])
+        if name in hashlib.algorithms_available
+    ]
+    return names, bool(names)
+
+
+def hasher(name):
+    return getattr(hashlib, name, None) or (lambda data: hashlib.new(name, data))
+
+
+def search_range(path, start, end, targets):
+    """
+    Hash every line of the wordlist at `path` that starts in [start, end)
+    with each of the (algorithm, digest) `targets`.
+    Returns the matching (word, algorithm) or None, the CPU seconds spent and
+    the number of words tried.
+    """
+    cpu_start = time.process_time()
+    hashers = [(hasher(name), bytes.fromhex(digest), name) for name, digest in targets]
+    match = None
+    words = 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if start > 0:
+            # The line running into `start` belongs to the previous range
+            start = mm.find(b"\n", start - 1) + 1 or len(mm)
+        stop = mm.find(b"\n", end - 1) if end < len(mm) else -1
+        block = mm[start : len(mm) if stop == -1 else stop] if start < end else b""
+
+    if block.endswith(b"\n"):
+        block = block[:-1]
+    for word in block.split(b"\n") if block else []:
+        word = word.rstrip(b"\r")
+        words += 1
+        for func, digest, name in hashers:
+            if func(word).digest() == digest:
+                match = (word, name)
+                break
+        if match:
+            break
+    return match, time.process_time() - cpu_start, words
+
+
+class HashCracker:
+    """
+    Cracks hashes against the wordlist at `wordlist`, which is cut into
+    `chunk_bytes` ranges searched by the worker processes with at most
+    `max_in_flight` ranges queued at a time. Nothing new is queued once a
+    word is found or the guild used up its `quota`.
+    How far every hash got (and what was found) is saved to `path`, so an
+    interrupted crack picks up where it stopped.
+    """
+
+    def __init__(self, path, wordlist, quota, *, chunk_bytes=4 * 1024**2, max_in_flight=2):
+        self.path = path
+        self.wordlist = wordlist
+        self.quota = quota
+        self.chunk_bytes = chunk_bytes
+        self.max_in_flight = max_in_flight
+        state = load_json(path, {})
+        self.offsets = state.get("offsets", {})
+        self.found = state.get("found", {})
+        self.running = set()
+
+    def save(self):
+        save_json(self.path, {"offsets": self.offsets, "found": self.found})
+
+    def job_id(self, digest, names):
+        stat = os.stat(self.wordlist)
+        return f"{','.join(names)}:{digest}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def cached(self, digest, names):
+        for name in names:
+            word = self.found.get(f"{name}:{digest}")
+            if word is not None:
+                return word.encode("latin-1"), name
+        return None
+
+    async def crack(self, key, digest, names, progress=None):
+        """
+        Search the wordlist for the word hashing to `digest` with one of
+        `names`, charging the CPU time to `key`. `progress` is awaited with
+        the bytes searched and the wordlist size after every range.
+        """
+        digest = digest.strip().lower()
+        size = os.path.getsize(self.wordlist)
+        cached = self.cached(digest, names)
+        if cached:
+            return Result(*cached, size, size, "found")
+        if key in self.running:
+            raise RuntimeError("A crack is already running")
+
+        job_id = self.job_id(digest, names)
+        offset = self.offsets.get(job_id, 0)
+        targets = [(name, digest) for name in names]
+        starts = iter(range(offset, size, self.chunk_bytes))
+        loop = asyncio.get_running_loop()
+        pending = {}
+        done = set()
+        match = None
+        reason = "exhausted"
+
+        self.running.add(key)
+        try:
+            while True:
+                while len(pending) < self.max_in_flight:
+                    if self.quota.remaining(key) <= 0:
+                        reason = "quota"
+                        break
+                    start = next(starts, None)
+                    if start is None:
+                        break
+                    end = min(start + self.chunk_bytes, size)
+                    future = loop.run_in_executor(
+                        process_pool(), search_range, self.wordlist, start, end, targets
+                    )
+                    pending[future] = (start, end)
+                if not pending:
+                    break
+
+                finished, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in finished:
+                    start, end = pending.pop(future)
+                    found, cpu_seconds, _ = future.result()
+                    self.quota.charge(key, cpu_seconds)
+                    match = match or found
+                    done.add(start)
+                    # Only the ranges searched without a gap count as progress
+                    while offset in done:
+                        done.remove(offset)
+                        offset = min(offset + self.chunk_bytes, size)
+
+                if match is not None:
+                    # Ranges still being searched are left to finish on their own
+                    break
+                self.offsets[job_id] = offset
+                self.save()
+                if progress is not None:
+                    await progress(offset, size)
+        finally:
+            self.running.discard(key)
+            for future in pending:
+                future.cancel()
+
+        if match is not None:
+            word, name = match
+            self.found[f"{name}:{digest}"] = word.decode("latin-1")
+            self.offsets.pop(job_id, None)
+            self.save()
+            return Result(word, name, offset, size, "found")
+        if reason == "exhausted":
+            self.offsets.pop(job_id, None)
+            self.save()
+        return Result(None, None, offset, size, reason)
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from collections import namedtuple
+
+import aiohttp
+
+# Retry on these status codes, everything else is returned (or raised) as is
+retry_statuses = {429, 500, 502, 503, 504}
+
+Response = namedtuple("Response", ["status", "headers", "data"])
+
+
+class HTTPClient:
+    """
+    Shared, connection pooled aiohttp session used by every cog.
+    The session is created lazily since it has to live on the bot's event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        limit=100,
+        limit_per_host=8,
+        keepalive_timeout=30,
+        timeout=10,
+        retries=3,
+        backoff=0.5,
+        headers=None,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers or {}
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def get_json(self, url, **kwargs):
+        """
+        GET `url` and decode the body as json.
+        """
+        res = await self.get(url, **kwargs)
+        return res.data
+
+    async def get(self, url, *, params=None, headers=None, timeout=None, retries=None):
+        """
+        GET `url` and return a `Response` with the json decoded body.
+        Connection errors, timeouts and retryable statuses are retried with
+        exponential backoff, the last error is raised.
+        A 304 Not Modified is returned with `data` set to None.
+        """
+        retries = self.retries if retries is None else retries
+        timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.get(
+                    url, params=params, headers=headers, timeout=timeout
+                ) as res:
+                    if res.status in retry_statuses and attempt < retries:
+                        delay = self._retry_after(res, attempt)
+                        logging.info(f"{url} returned {res.status}, retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    if res.status == 304:
+                        return Response(res.status, res.headers, None)
+                    res.raise_for_status()
+                    return Response(
+                        res.status, res.headers, await res.json(content_type=None)
+                    )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                logging.info(f"Request to {url} failed, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def stream(self, url, *, chunk_size=64 * 1024, timeout=60):
+        """
+        GET `url` and yield the body `chunk_size` bytes at a time, without
+        holding all of it in memory. Not retried, since part of it is
+        already consumed by the time an error shows up.
+        """
+        timeout = aiohttp.ClientTimeout(total=timeout)
+        async with self.session.get(url, timeout=timeout) as res:
+            res.raise_for_status()
+            async for chunk in res.content.iter_chunked(chunk_size):
+                yield chunk
+
+    def _retry_after(self, res, attempt):
+        retry_after = res.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), 30)
+        return self.backoff * 2**attempt
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
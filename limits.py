@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from discord.ext import commands
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight call.
+    Every caller that arrives while the call is running gets the same result
+    (or exception) instead of firing its own upstream request.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shield so one cancelled waiter doesn't cancel the call for everyone
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class CPUQuota:
+    """
+    Budget of `seconds` CPU seconds per key (a guild) that refills evenly
+    over `per` seconds. Work is charged after it's done, so a key can go a
+    little over before it's stopped.
+    """
+
+    def __init__(self, seconds, per):
+        self.seconds = seconds
+        self.per = per
+        self._used = {}
+
+    def used(self, key):
+        used, stamp = self._used.get(key, (0.0, 0.0))
+        now = time.monotonic()
+        return max(0.0, used - (now - stamp) * self.seconds / self.per)
+
+    def remaining(self, key):
+        return self.seconds - self.used(key)
+
+    def charge(self, key, seconds):
+        self._used[key] = (self.used(key) + seconds, time.monotonic())
+
+
+class SlowDown(commands.CheckFailure):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Slow down! Try again in {retry_after:.0f}s.")
+
+
+class InputTooLarge(commands.CheckFailure):
+    def __init__(self, limit):
+        self.limit = limit
+        super().__init__(f"That's too big, inputs can be up to {limit / 1024**2:.0f} MiB.")
+
+
+# (user_rate, guild_rate, per) -> the user and guild buckets of admission()
+_admission_buckets = {}
+
+
+def admission(user_rate=3, guild_rate=15, per=30):
+    """
+    Token bucket admission check for commands that do upstream work.
+    A user may run `user_rate` and a guild `guild_rate` of the guarded
+    commands every `per` seconds, anything above that is shed with `SlowDown`
+    before the command body runs. The buckets are shared by every command
+    guarded with the same rates, so the limit counts all of them together.
+    """
+    key = (user_rate, guild_rate, per)
+    if key not in _admission_buckets:
+        _admission_buckets[key] = (
+            commands.CooldownMapping.from_cooldown(
+                user_rate, per, commands.BucketType.user
+            ),
+            commands.CooldownMapping.from_cooldown(
+                guild_rate, per, commands.BucketType.guild
+            ),
+        )
+    user_buckets, guild_buckets = _admission_buckets[key]
+
+    async def predicate(ctx):
+        now = ctx.message.created_at.timestamp()
+        user_bucket = user_buckets.get_bucket(ctx.message, now)
+        guild_bucket = guild_buckets.get_bucket(ctx.message, now)
+
+        # Only take tokens when both buckets have one so a rejected call is free
+        retry_after = max(
+            user_bucket.get_retry_after(now), guild_bucket.get_retry_after(now)
+        )
+        if user_bucket.get_tokens(now) == 0 or guild_bucket.get_tokens(now) == 0:
+            raise SlowDown(retry_after)
+
+        user_bucket.update_rate_limit(now)
+        guild_bucket.update_rate_limit(now)
+        return True
+
+    return commands.check(predicate)
@@ -0,0 +1,65 @@
+import heapq
+import re
+import time
+
+import numpy as np
+
+from analysis import entropy
+from transforms import decoders
+from xor import byte_weights, printable
+
+# flag{...}, CTF{...}, picoCTF{...} and friends
+flag_re = re.compile(rb"(?i)[a-z0-9_]*(?:flag|ctf)[a-z0-9_]*\{[^\s{}]{1,200}\}")
+
+
+def printable_ratio(data):
+    return float(printable[np.frombuffer(data, dtype=np.uint8)].mean())
+
+
+def score(data):
+    """
+    How much `data` looks like the end of the road: English-like bytes,
+    low entropy and a big bonus for a flag.
+    """
+    english = float(byte_weights[np.frombuffer(data, dtype=np.uint8)].mean())
+    bonus = 1.0 if flag_re.search(data) else 0.0
+    return english - entropy(data) / 100 + bonus
+
+
+def magic(data, max_depth=8, time_budget=5.0, max_nodes=20000, min_printable=0.9, max_entropy=7.0):
+    """
+    Best-first search over chains of decoders until a flag shows up.
+    Branches that decode to mostly unprintable or high entropy bytes are
+    pruned, and every intermediate output is only expanded once.
+    Returns (flag found, list of decoder names, output) of the best node.
+    """
+    deadline = time.monotonic() + time_budget
+    counter = 0
+    heap = [(-score(data), counter, data, [])]
+    seen = {data}
+    best = (score(data), data, [])
+
+    while heap and counter < max_nodes and time.monotonic() < deadline:
+        neg_score, _, node, path = heapq.heappop(heap)
+        if -neg_score > best[0]:
+            best = (-neg_score, node, path)
+        if flag_re.search(node):
+            return True, path, node
+        if len(path) >= max_depth:
+            continue
+
+        for name, decode in decoders.items():
+            try:
+                out = decode(node)
+            except Exception:
+                continue
+            if not out or out in seen:
+                continue
+            seen.add(out)
+            if printable_ratio(out) < min_printable or entropy(out) > max_entropy:
+                continue
+            counter += 1
+            heapq.heappush(heap, (-score(out), counter, out, path + [name]))
+
+    _, node, path = best
+    return False, path, node
@@ -1,21 +1,44 @@
 import asyncio
-import base64
-import binascii
 import datetime
+import gzip
 import html
+import io
+import itertools
 import logging
 import os
 import random
-import string
-from urllib.parse import parse_qs, quote, unquote, urlparse
+import shutil
+import tempfile
+import time
 
 import discord
 import mysql.connector
-import requests
+import transforms
 import wikipedia
-from discord.ext import commands
-from music import YTDLSource
-from yt_dlp import YoutubeDL
+from analysis import NgramCounter, table, to_csv
+from audio_cache import AudioCache
+from batching import MicroBatcher, TTLCache
+from ciphers import Caesar
+from cleanup import DeletionScheduler
+from ctftime import EventsCache
+from database import Database
+from discord.ext import commands, tasks
+from hashcrack import HashCracker, identify
+from http_client import HTTPClient
+from limits import CPUQuota, InputTooLarge, SingleFlight, SlowDown, admission
+from magic import magic
+from memes import MemePool
+from music import GuildPlayer, MeteredSource, TrackResolver
+from pipeline import Pipeline
+from pipeline import parse as parse_pipeline
+from polls import PollIndex
+from scoring import rank_shifts
+from track_cache import TrackCache
+from trivia import QuestionBuffer
+from vigenere import crack as crack_vigenere
+from vigenere import decrypt as decrypt_vigenere
+from workers import max_workers, run_in_process, shutdown_workers
+from xor import crack_repeating, crack_single, parse_blob, xor
 
 logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO)
 
@@ -31,59 +54,127 @@ headers = {
 poll_emojis = ["1⃣", "2⃣", "3⃣", "4⃣", "5⃣", "6⃣", "7⃣", "8⃣", "9⃣"]
 
 delete_seconds = 300
-
-
-mydb = mysql.connector.connect(
+message_limit = 2000
+# Number of rotations /rot answers with
+rot_candidates = 5
+# Inputs bigger than this are processed in the worker processes
+offload_bytes = 256 * 1024
+# Most common n-grams /counteach lists in its table and csv
+table_ngrams = 10
+csv_ngrams = 5000
+# Biggest attachment a command reads
+max_input_bytes = int(os.environ.get("MAX_INPUT_MB", 25)) * 1024**2
+# Outputs bigger than this are kept on disk instead of in memory
+spool_bytes = 1024 * 1024
+# Upload limit outside of guilds (guilds have their own)
+default_upload_limit = 8 * 1024 * 1024
+# CPU seconds a /vigenere crack may use
+vigenere_cpu_budget = float(os.environ.get("VIGENERE_CPU_SECONDS", 5))
+# Seconds and number of layers /magic searches for
+magic_time_budget = float(os.environ.get("MAGIC_SECONDS", 5))
+magic_max_depth = 8
+# CPU seconds per hour a guild's /hash cracks may use
+hash_cpu_seconds = float(os.environ.get("HASH_CPU_SECONDS", 600))
+# Seconds between updates of a running /hash crack
+progress_seconds = 5
+
+data_dir = os.environ.get("DATA_DIR", "data")
+os.makedirs(data_dir, exist_ok=True)
+
+lofi_query = "lofi hip hop radio"
+# Spawn the next song's ffmpeg this many seconds before the current one ends
+prebuffer_seconds = 20
+
+
+mindsdb = Database(
+    pool_size=4,
+    query_timeout=30,
     host="cloud.mindsdb.com",
     user=os.environ.get("MINDSDB_USER"),
     password=os.environ.get("MINDSDB_PASSW"),
     port=3306,
 )
-cursor = mydb.cursor()
 
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix="/",
-                   strip_after_prefix=True,
-                   intents=intents)
+http_client = HTTPClient(headers=headers)
+events_cache = EventsCache(http_client, events_url, window=15)
+flights = SingleFlight()
+meme_pool = MemePool(http_client, joke_url)
+track_cache = TrackCache(os.path.join(data_dir, "tracks.sqlite3"))
+track_resolver = TrackResolver(max_workers=4, cache=track_cache)
+
+# Opus files of often played songs, only kept when AUDIO_CACHE_DIR is set
+audio_cache = None
+if os.environ.get("AUDIO_CACHE_DIR"):
+    audio_cache = AudioCache(
+        os.environ["AUDIO_CACHE_DIR"],
+        min_plays=int(os.environ.get("AUDIO_CACHE_MIN_PLAYS", 3)),
+        max_bytes=int(os.environ.get("AUDIO_CACHE_MB", 2048)) * 1024**2,
+    )
+
+# Wordlist cracking for /hash crack, only available when WORDLIST_PATH is set
+hash_cracker = None
+if os.environ.get("WORDLIST_PATH"):
+    hash_cracker = HashCracker(
+        os.path.join(data_dir, "hashes.json"),
+        os.environ["WORDLIST_PATH"],
+        CPUQuota(hash_cpu_seconds, 3600),
+        # Leave workers free for the other commands
+        max_in_flight=max(1, max_workers // 2),
+    )
 
 
-def get_upcoming_ctfs(limit=2):
-    res = requests.get(events_url, params={"limit": limit}, headers=headers)
-    return res.json()
+class CTFContext(commands.Context):
+    """
+    Hands `delete_after` to the deletion scheduler instead of leaving a
+    sleeping task behind for every message.
+    """
 
+    async def send(self, *args, delete_after=None, **kwargs):
+        message = await super().send(*args, **kwargs)
+        if delete_after is not None:
+            deletions.schedule(message, delete_after)
+        return message
 
-def get_random_quote():
-    res = requests.get(quote_url)
-    return res.json()
+    async def reply(self, *args, delete_after=None, **kwargs):
+        message = await super().reply(*args, **kwargs)
+        if delete_after is not None:
+            deletions.schedule(message, delete_after)
+        return message
 
 
-def get_random_joke():
-    res = requests.get(joke_url, headers=headers)
-    joke = res.json()
-    joke = random.choice(joke["data"]["children"])["data"]
-    is_nsfw = joke.get("over_18")
-    if is_nsfw:
-        return get_random_joke()
-    return joke.get("url", ""), joke.get("title", "**Joke**"), joke.get("permalink", "")
+class CTFBot(commands.Bot):
+    async def get_context(self, message, *, cls=CTFContext):
+        return await super().get_context(message, cls=cls)
 
+    async def close(self):
+        await deletions.stop()
+        polls.save()
+        await http_client.close()
+        mindsdb.close()
+        shutdown_workers()
+        await super().close()
 
-def get_youtube_audio(arg):
-    YDL_OPTIONS = {'format': 'bestaudio', 'noplaylist':'True', 'quiet': True}
-    with YoutubeDL(YDL_OPTIONS) as ydl:
-        try:
-            requests.get(arg) 
-        except:
-            audio = ydl.extract_info(f"ytsearch:{arg}", download=False)['entries'][0]
-        else:
-            audio = ydl.extract_info(arg, download=False)
 
-    return {
-        "title": audio.get("title", ""),
-        "thumbnail": audio.get("thumbnail", ""),
-        "artist": audio.get("channel", ""),
-        "url": f"https://youtube.com/watch?v={audio.get('id')}"
-    }
+intents = discord.Intents.default()
+intents.message_content = True
+bot = CTFBot(command_prefix="/",
+             strip_after_prefix=True,
+             intents=intents)
+deletions = DeletionScheduler(bot, os.path.join(data_dir, "deletions.json"))
+polls = PollIndex(os.path.join(data_dir, "polls.json"))
+
+
+async def get_upcoming_ctfs(limit=2):
+    # EventsCache coalesces concurrent refreshes itself
+    return await events_cache.get(limit)
+
+
+async def get_random_quote():
+    return await flights.do("quote", http_client.get_json, quote_url)
+
+
+async def get_random_joke():
+    return await meme_pool.get()
 
 
 def get_wikipedia_summary(topic):
@@ -94,119 +185,288 @@ def get_wikipedia_summary(topic):
     return page.title, page.summary, page.url
 
 
+async def read_input(ctx, text):
+    """
+    The first attachment of a command in chunks, or its text in one go.
+    Every command reads its attachments through here, so they all share
+    the `max_input_bytes` limit.
+    """
+    if ctx.message.attachments:
+        size = 0
+        async for chunk in http_client.stream(ctx.message.attachments[0].url):
+            # The input_size check already turned away attachments that say
+            # they're too big, this catches the ones that lie
+            size += len(chunk)
+            if size > max_input_bytes:
+                raise InputTooLarge(max_input_bytes)
+            yield chunk
+    else:
+        yield text.encode()
+
+
+async def read_all(ctx, text):
+    return b"".join([chunk async for chunk in read_input(ctx, text)])
+
+
+def usage(ctx):
+    return f"Usage: /{ctx.command.qualified_name} {ctx.command.signature}"
+
+
+async def missing_input(ctx, text):
+    """
+    Reply with the usage of the command when it got neither text nor an
+    attachment to work on.
+    """
+    if text.strip() or ctx.message.attachments:
+        return False
+    await ctx.reply(f"{usage(ctx)} (or attach a file)", delete_after=delete_seconds)
+    return True
+
+
+async def get_text(ctx, text):
+    """
+    The text passed to a command, or the content of its first attachment.
+    """
+    if ctx.message.attachments:
+        data = await read_all(ctx, text)
+        return data.decode(errors="replace")
+    return text
+
+
+async def get_bytes(ctx, text):
+    """
+    The hex/base64 (or plain) text passed to a command as bytes, or the
+    content of its first attachment, and what it was read as.
+    """
+    if ctx.message.attachments:
+        data = await read_all(ctx, text)
+        try:
+            return parse_blob(data.decode("ascii"))
+        except UnicodeDecodeError:
+            return data, "raw"
+    return parse_blob(text)
+
+
+async def run_cpu_bound(size, func, *args, timeout=60):
+    """
+    Run `func` right here for small inputs and in a worker process for big ones.
+    """
+    if size > offload_bytes:
+        return await run_in_process(func, *args, timeout=timeout)
+    return func(*args)
+
+
+async def reply_text(ctx, text, filename="output.txt"):
+    """
+    Reply with `text` in a code block, or as a file when it's too long for one.
+    """
+    if len(text) + 6 <= message_limit:
+        return await ctx.reply(f"```{text}```", delete_after=delete_seconds)
+    return await ctx.reply(
+        file=discord.File(io.BytesIO(text.encode()), filename=filename),
+        delete_after=delete_seconds,
+    )
+
+
+async def reply_file(ctx, out, filename="output.txt"):
+    """
+    Reply with the content of the file `out` in a code block, or as an
+    attachment (gzipped when it's over the upload limit) when it doesn't fit.
+    """
+    size = out.tell()
+    out.seek(0)
+    if size + 6 <= message_limit:
+        try:
+            return await ctx.reply(
+                f"```{out.read().decode()}```", delete_after=delete_seconds
+            )
+        except UnicodeDecodeError:
+            out.seek(0)
+
+    limit = ctx.guild.filesize_limit if ctx.guild else default_upload_limit
+    if size <= limit:
+        return await ctx.reply(
+            file=discord.File(out, filename=filename), delete_after=delete_seconds
+        )
+
+    with tempfile.SpooledTemporaryFile(max_size=spool_bytes) as compressed:
+        with gzip.GzipFile(filename=filename, mode="wb", fileobj=compressed) as gz:
+            await asyncio.to_thread(shutil.copyfileobj, out, gz)
+        if compressed.tell() > limit:
+            return await ctx.reply(
+                "The result is too big to upload, even gzipped",
+                delete_after=delete_seconds,
+            )
+        compressed.seek(0)
+        return await ctx.reply(
+            file=discord.File(compressed, filename=f"{filename}.gz"),
+            delete_after=delete_seconds,
+        )
+
+
+async def transform_reply(ctx, names, text, filename="output.txt"):
+    """
+    Stream the message (or its attachment) through the pipeline stages
+    `names` and reply with the result.
+    """
+    pipeline = Pipeline(names)
+    with tempfile.SpooledTemporaryFile(max_size=spool_bytes) as out:
+        async for chunk in read_input(ctx, text):
+            out.write(pipeline.feed(chunk))
+        out.write(pipeline.flush())
+        await reply_file(ctx, out, filename)
+
+
 def unhex(*hex_str):
     hex_str = "".join(hex_str)
-    if hex_str.startswith("0x"):
-        hex_str = hex_str[2:]
-
-    encoded_string = bytes.fromhex(hex_str)
-    return encoded_string.decode()
+    return transforms.hexd(hex_str.encode()).decode()
 
 
-def chatbot(username, prompt):
-    cursor.execute(
-        """SELECT response from mindsdb.snowlon_model
+chat_query = """SELECT %s AS idx, response from mindsdb.snowlon_model
 WHERE 
 author_username = %s 
-AND text=%s;""",
-        (username, prompt),
-    )
-    out = ""
-    for response in cursor:
-        out = response[0]
-    return out
+AND text=%s"""
 
 
-class Caesar:
-    caesar_charset = string.ascii_lowercase
+# After the server rejects a batched query, batches are sent one query per
+# prompt for this many seconds instead of paying for a failed UNION ALL every time
+union_backoff = 3600
+union_disabled_until = 0.0
 
-    @staticmethod
-    def encrypt(msg: str, key: int):
-        out = ""
-        for char in msg:
-            try:
-                shift = (Caesar.caesar_charset.index(char.lower()) + key) % 26
-                out += (
-                    Caesar.caesar_charset[shift]
-                    if char.islower()
-                    else Caesar.caesar_charset[shift].upper()
-                )
-            except ValueError:
-                out += char
-        return out
 
-    @staticmethod
-    def decrypt(msg: str, key: int):
-        return Caesar.encrypt(msg, -key)
+async def chat_one_by_one(prompts):
+    results = await asyncio.gather(*(chat_batch([prompt]) for prompt in prompts))
+    return [result[0] for result in results]
 
 
-class Rot13:
-    @staticmethod
-    def encrypt(msg):
-        return Caesar.encrypt(msg, 13)
+async def chat_batch(prompts):
+    """
+    Answer a batch of (username, prompt) pairs in one round-trip.
+    """
+    global union_disabled_until
+    if len(prompts) > 1 and time.monotonic() < union_disabled_until:
+        return await chat_one_by_one(prompts)
 
+    try:
+        rows = await mindsdb.fetchall(
+            " UNION ALL ".join([chat_query] * len(prompts)) + ";",
+            [param for i, prompt in enumerate(prompts) for param in (i, *prompt)],
+        )
+    except mysql.connector.OperationalError:
+        # Timeouts and lost connections fail the batch, asking again one by
+        # one would only wait on the same server twice
+        raise
+    except mysql.connector.DatabaseError:
+        if len(prompts) == 1:
+            raise
+        logging.exception(
+            f"Batched chat query rejected, querying one by one for {union_backoff}s"
+        )
+        union_disabled_until = time.monotonic() + union_backoff
+        return await chat_one_by_one(prompts)
 
-class Rot47:
-    rot47_charset = "!\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+    out = [""] * len(prompts)
+    for idx, response in rows:
+        out[int(idx)] = response
+    return out
 
-    @staticmethod
-    def encrypt(msg: str):
-        out = ""
-        for char in msg:
-            try:
-                shift = (Rot47.rot47_charset.index(char) + 47) % 94
-                out += Rot47.rot47_charset[shift]
-            except ValueError:
-                out += char
-        return out
 
-    @staticmethod
-    def decrypt(msg: str):
-        out = ""
-        for char in msg:
-            try:
-                shift = (Rot47.rot47_charset.index(char) - 47) % 94
-                out += Rot47.rot47_charset[shift]
-            except ValueError:
-                out += char
-        return out
+chat_cache = TTLCache(ttl=600, maxsize=1024)
+chat_batcher = MicroBatcher(chat_batch, window=0.1, max_batch=16)
+
+
+async def chatbot(username, prompt):
+    key = (username, " ".join(prompt.lower().split()))
+    out = chat_cache.get(key)
+    if out is None:
+        out = await flights.do(("chat", key), chat_batcher.submit, (username, prompt))
+        chat_cache.set(key, out)
+    return out
 
 
 @bot.event
 async def on_raw_reaction_add(payload):
-    channel = await bot.fetch_channel(payload.channel_id)
-    message = await channel.fetch_message(payload.message_id)
-    reaction = discord.utils.get(message.reactions, emoji=payload.emoji.name)
+    if payload.message_id not in polls or payload.user_id == bot.user.id:
+        return
 
-    if payload.user_id != bot.user.id and payload.emoji.name not in poll_emojis:
-        await reaction.remove(payload.member)
+    if not polls.vote(payload.message_id, payload.emoji.name, 1):
+        message = bot.get_partial_messageable(payload.channel_id).get_partial_message(
+            payload.message_id
+        )
+        await message.remove_reaction(payload.emoji, discord.Object(id=payload.user_id))
+
+
+@bot.event
+async def on_raw_reaction_remove(payload):
+    if payload.message_id in polls and payload.user_id != bot.user.id:
+        polls.vote(payload.message_id, payload.emoji.name, -1)
+
+
+@tasks.loop(seconds=30)
+async def save_polls():
+    polls.save()
+
+
+@bot.check
+async def input_size(ctx):
+    """
+    Turn away attachments over the input limit before the command runs.
+    """
+    if any(a.size > max_input_bytes for a in ctx.message.attachments):
+        raise InputTooLarge(max_input_bytes)
+    return True
+
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, (SlowDown, InputTooLarge)):
+        await ctx.reply(str(error), delete_after=delete_seconds)
+    elif isinstance(error, commands.MissingRequiredArgument):
+        await ctx.reply(usage(ctx), delete_after=delete_seconds)
+    elif isinstance(error, commands.CommandNotFound):
+        return
+    else:
+        logging.error("Exception occurred", exc_info=error)
 
 
 @bot.event
 async def on_ready():
     print(f"We have logged in as {bot.user}")
+    deletions.start()
+    if not save_polls.is_running():
+        save_polls.start()
+    meme_pool.refill_soon()
 
 
 @bot.after_invoke
 async def common(message):
-    try:
-        await asyncio.sleep(delete_seconds)
-        await message.message.delete()
-    except Exception as e:
-        logging.exception("Exception occurred")
+    deletions.schedule(message.message, delete_seconds)
 
 
 class CTF(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.refresh_events.start()
+
+    def cog_unload(self):
+        self.refresh_events.cancel()
+
+    @tasks.loop(seconds=events_cache.ttl - events_cache.refresh_margin)
+    async def refresh_events(self):
+        await events_cache.refresh_soon()
+
+    @refresh_events.before_loop
+    async def before_refresh_events(self):
+        await self.bot.wait_until_ready()
 
     @commands.command("upcoming-ctfs")
+    @admission()
     async def upcoming_ctfs(self, ctx, num=2):
         """
         List upcoming CTFs on ctftime.org
         """
-        num = min(15, num)
-        for ctf in get_upcoming_ctfs(num):
+        num = min(events_cache.window, num)
+        for ctf in await get_upcoming_ctfs(num):
             if ctf.get("restrictions").lower() == "open":
                 title = ctf.get("title")
                 url = ctf.get("url")
@@ -236,12 +496,13 @@ class Miscellaneous(commands.Cog):
         self.bot = bot
 
     @commands.command("quote")
+    @admission()
     async def quote(self, ctx):
         """
         Get random quote
         """
         try:
-            quote = get_random_quote()
+            quote = await get_random_quote()
             content = quote.get("content")
             author = quote.get("author")
             embed = discord.Embed(
@@ -252,12 +513,13 @@ class Miscellaneous(commands.Cog):
             logging.exception("Exception occurred")
 
     @commands.command("joke")
+    @admission()
     async def joke(self, ctx):
         """
         Gets a random joke from reddit.
         """
         try:
-            url, title, link = get_random_joke()
+            url, title, link = await get_random_joke()
             embed = discord.Embed(
                 title=title,
                 color=discord.Colour.orange(),
@@ -276,7 +538,7 @@ class Miscellaneous(commands.Cog):
         Gets summary of a topic from wikipedia.
         """
         try:
-            data = get_wikipedia_summary(topic)
+            data = await asyncio.to_thread(get_wikipedia_summary, topic)
             if not data:
                 await ctx.reply(
                     "Sorry we can't find summary about that topic.",
@@ -295,7 +557,7 @@ class Miscellaneous(commands.Cog):
         except wikipedia.DisambiguationError as e:
             try:
                 topic = e.options
-                data = get_wikipedia_summary(str(topic[0]))
+                data = await asyncio.to_thread(get_wikipedia_summary, str(topic[0]))
                 if not data:
                     await ctx.reply(
                         "Sorry we can't find summary about that topic.",
@@ -339,17 +601,303 @@ class Miscellaneous(commands.Cog):
             )
 
     @commands.command("rot")
-    async def rot(self, ctx, *, text):
+    async def rot(self, ctx, *, text=""):
+        """
+        /rot "a message" Returns the rotations of a message that look most like English.
+        """
+        if await missing_input(ctx, text):
+            return
+        try:
+            text = await get_text(ctx, text)
+            out = "\n".join(
+                f"ROT{shift} (score {score:.1f}): {Caesar.decrypt(text, shift)}"
+                for shift, score in rank_shifts(text, top=rot_candidates)
+            )
+            await reply_text(ctx, out, "rot.txt")
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
+    @commands.group("vigenere", invoke_without_command=True)
+    async def vigenere(self, ctx):
+        """
+        Vigenère cipher tools.
+        Usage: vigenere crack message (or an attached file)
+        """
+        await ctx.reply(
+            "Usage: /vigenere crack message (or attach a file)",
+            delete_after=delete_seconds,
+        )
+
+    @vigenere.command("crack")
+    async def vigenere_crack(self, ctx, *, text=""):
+        """
+        Finds the key of a Vigenère cipher and decrypts it.
+        """
+        if await missing_input(ctx, text):
+            return
+        try:
+            text = await get_text(ctx, text)
+            results = await run_in_process(
+                crack_vigenere,
+                text,
+                20,
+                vigenere_cpu_budget,
+                timeout=vigenere_cpu_budget * 2 + 10,
+            )
+            if not results:
+                return await ctx.reply(
+                    "Sorry that's too short to crack.", delete_after=delete_seconds
+                )
+
+            out = ""
+            for i, (key, ioc) in enumerate(results):
+                shifts = [ord(c) - ord("A") for c in key]
+                if i == 0:
+                    plain = await run_cpu_bound(len(text), decrypt_vigenere, text, shifts)
+                else:
+                    # Other keys only show how the start of the text comes out
+                    plain = decrypt_vigenere(text[:200], shifts)
+                out += f"Key {key} (IoC {ioc:.4f}):\n{plain}\n\n"
+            await reply_text(ctx, out.strip(), "vigenere.txt")
+        except asyncio.TimeoutError:
+            await ctx.reply(
+                "Sorry that took too long to crack.", delete_after=delete_seconds
+            )
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
+    @commands.group("hash", invoke_without_command=True)
+    async def hash(self, ctx):
+        """
+        Hash tools.
+        Usage: hash [identify|crack] hash
+        """
+        await ctx.reply(
+            "Usage: /hash identify <hash> or /hash crack <hash> [algorithm]",
+            delete_after=delete_seconds,
+        )
+
+    @hash.command("identify")
+    async def hash_identify(self, ctx, digest):
+        """
+        Names the algorithms a hash could come from.
+        """
+        names, crackable = identify(digest)
+        if not names:
+            return await ctx.reply(
+                "That doesn't look like a hash I know.", delete_after=delete_seconds
+            )
+        note = "" if crackable else ", it's salted so /hash crack can't do it"
+        await ctx.reply(
+            f"Could be {', '.join(names)}{note}", delete_after=delete_seconds
+        )
+
+    @hash.command("crack")
+    async def hash_crack(self, ctx, digest, algorithm=None):
+        """
+        Looks for a hash in the wordlist. A crack that runs out of time
+        continues where it stopped the next time it's asked for.
+        """
+        if hash_cracker is None:
+            return await ctx.reply(
+                "Sorry there's no wordlist set up.", delete_after=delete_seconds
+            )
+        names, crackable = identify(digest)
+        if algorithm is not None:
+            if algorithm not in names:
+                return await ctx.reply(
+                    f"{algorithm} doesn't make hashes like that.",
+                    delete_after=delete_seconds,
+                )
+            names = [algorithm]
+        if not crackable:
+            return await ctx.reply(
+                "Sorry I can't crack that kind of hash.", delete_after=delete_seconds
+            )
+
+        key = ctx.guild.id if ctx.guild else ctx.author.id
+        if hash_cracker.quota.remaining(key) <= 0:
+            return await ctx.reply(
+                "This server used up its cracking time, try again later.",
+                delete_after=delete_seconds,
+            )
+
+        if key in hash_cracker.running:
+            return await ctx.reply(
+                "There's already a crack running here, wait for it to finish.",
+                delete_after=delete_seconds,
+            )
+
+        status = await ctx.reply(f"Cracking as {', '.join(names)}...")
+        last_update = time.monotonic()
+
+        async def progress(offset, size):
+            nonlocal last_update
+            if time.monotonic() - last_update >= progress_seconds:
+                last_update = time.monotonic()
+                await status.edit(
+                    content=f"Cracking as {', '.join(names)}... "
+                    f"{100 * offset / size:.1f}% of the wordlist done"
+                )
+
+        try:
+            result = await hash_cracker.crack(key, digest, names, progress)
+            if result.reason == "found":
+                word = result.word.decode(errors="replace")
+                content = f"Found it ({result.algorithm}): ```{word}```"
+            elif result.reason == "quota":
+                content = (
+                    f"Out of cracking time at {100 * result.offset / result.size:.1f}% "
+                    "of the wordlist, run the same command later to continue."
+                )
+            else:
+                content = "Not in the wordlist."
+            await status.edit(content=content)
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await status.edit(content="Sorry something went wrong :(")
+        finally:
+            # Only counts from the end, a crack can take longer than this
+            deletions.schedule(status, delete_seconds)
+
+    @commands.command("magic")
+    async def magic(self, ctx, *, text=""):
+        """
+        Peels off layers of base64, base32, hex, binary, url, rot13 and rot47
+        until a flag shows up.
+        """
+        if await missing_input(ctx, text):
+            return
+        try:
+            text = await get_text(ctx, text)
+            found, path, out = await run_in_process(
+                magic,
+                text.encode(),
+                magic_max_depth,
+                magic_time_budget,
+                timeout=magic_time_budget * 2 + 10,
+            )
+            steps = " -> ".join(path) or "nothing"
+            header = "Found a flag" if found else "No flag found, best guess"
+            await reply_text(
+                ctx, f"{header} ({steps}):\n{out.decode(errors='replace')}", "magic.txt"
+            )
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
+    @commands.command("pipe")
+    async def pipe(self, ctx, *, text=""):
+        """
+        Runs the message (or attachment) through a chain of codecs.
+        Usage: pipe b64d | urld | rot13 | hex message
+        """
+        if await missing_input(ctx, text):
+            return
+        try:
+            names, text = parse_pipeline(text)
+        except ValueError as e:
+            return await ctx.reply(str(e), delete_after=delete_seconds)
+        if await missing_input(ctx, text):
+            return
+
+        try:
+            await transform_reply(ctx, names, text, "pipe.bin")
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
+    @commands.group("xor", invoke_without_command=True)
+    async def xor(self, ctx):
+        """
+        XOR tools, input is hex, base64 or an attached file.
+        Prefix it with 0x (or hex:) or b64: to say which.
+        Usage: xor [single|repeat] data, xor key key data
+        """
+        await ctx.reply(
+            "Usage: /xor single data, /xor repeat data or /xor key key data",
+            delete_after=delete_seconds,
+        )
+
+    @xor.command("single")
+    async def xor_single(self, ctx, *, data=""):
+        """
+        Brute forces all 256 single byte keys.
+        """
+        if await missing_input(ctx, data):
+            return
+        try:
+            data, kind = await get_bytes(ctx, data)
+            results = await run_cpu_bound(len(data), crack_single, data)
+            out = f"Input read as {kind}\n"
+            preview = data[:200]
+            for key, score, ratio in results:
+                plain = xor(preview, bytes([key])).decode(errors="replace")
+                out += f"Key 0x{key:02x} (score {score:.3f}, {ratio:.0%} printable): {plain}\n"
+            await reply_text(ctx, out.strip(), "xor.txt")
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
+    @xor.command("repeat")
+    async def xor_repeat(self, ctx, *, data=""):
         """
-        /rot "a message" Returns all 25 possible rotations for a message.
+        Recovers a repeating XOR key.
         """
+        if await missing_input(ctx, data):
+            return
         try:
-            out = "```"
-            for i in range(1, 26):
-                rot = Caesar.decrypt(text, i)
-                out += rot + "\n"
-            out += "```"
-            await ctx.reply(out, delete_after=delete_seconds)
+            data, kind = await get_bytes(ctx, data)
+            results = await run_cpu_bound(len(data), crack_repeating, data)
+            if not results:
+                return await ctx.reply(
+                    "Sorry that's too short to crack.", delete_after=delete_seconds
+                )
+
+            out = f"Input read as {kind}\n"
+            for i, (key, score) in enumerate(results):
+                if i == 0:
+                    plain = await run_cpu_bound(len(data), xor, data, key)
+                else:
+                    # The runners-up only get the first 200 bytes xored
+                    plain = xor(data[:200], key)
+                plain = plain.decode(errors="replace")
+                out += f"Key {key.hex()} {key!r} (score {score:.3f}):\n{plain}\n\n"
+            await reply_text(ctx, out.strip(), "xor.txt")
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
+    @xor.command("key")
+    async def xor_key(self, ctx, key, *, data=""):
+        """
+        XORs the data with a known key, text unless it starts with 0x
+        (or hex:) or b64:.
+        """
+        if await missing_input(ctx, data):
+            return
+        try:
+            data, kind = await get_bytes(ctx, data)
+            key, key_kind = parse_blob(key, guess=False)
+            plain = await run_cpu_bound(len(data), xor, data, key)
+            plain = plain.decode(errors="replace")
+            await reply_text(
+                ctx, f"Key read as {key_kind}, input as {kind}\n{plain}", "xor.txt"
+            )
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply(
@@ -357,13 +905,14 @@ class Miscellaneous(commands.Cog):
             )
 
     @commands.command("rot13")
-    async def rot13(self, ctx, *, text):
+    async def rot13(self, ctx, *, text=""):
         """
         Decrypt and encrypt message in rot13.
         """
+        if await missing_input(ctx, text):
+            return
         try:
-            rot13 = Rot13.encrypt(text)
-            await ctx.reply(f"```{rot13}```", delete_after=delete_seconds)
+            await transform_reply(ctx, ["rot13"], text, "rot13.txt")
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply(
@@ -371,13 +920,14 @@ class Miscellaneous(commands.Cog):
             )
 
     @commands.command("rot47")
-    async def rot47(self, ctx, *, text):
+    async def rot47(self, ctx, *, text=""):
         """
         Decrypt and encrypt message in rot47.
         """
+        if await missing_input(ctx, text):
+            return
         try:
-            rot47 = Rot47.encrypt(text)
-            await ctx.reply(f"```{rot47}```", delete_after=delete_seconds)
+            await transform_reply(ctx, ["rot47"], text, "rot47.txt")
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply(
@@ -385,13 +935,14 @@ class Miscellaneous(commands.Cog):
             )
 
     @commands.command("hex")
-    async def hex(self, ctx, *, text):
+    async def hex(self, ctx, *, text=""):
         """
         Hex the strings passed as arguments.
         """
+        if await missing_input(ctx, text):
+            return
         try:
-            hex_string = binascii.hexlify(text.encode()).decode()
-            await ctx.reply(hex_string, delete_after=delete_seconds)
+            await transform_reply(ctx, ["hexe"], text, "hex.txt")
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply(
@@ -399,16 +950,17 @@ class Miscellaneous(commands.Cog):
             )
 
     @commands.command("base64", aliases=["b64"])
-    async def base64(self, ctx, method, *, msg):
+    async def base64(self, ctx, method, *, msg=""):
         """
         Encode or decode in base64.
         Usage: base64 [e|d] message.
         For method use "e" for encoding and "d" for decoding
         """
+        if await missing_input(ctx, msg):
+            return
         if method[0] == "e":
             try:
-                base64_encoded = base64.b64encode(msg.encode()).decode()
-                await ctx.reply(f"```{base64_encoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, ["b64e"], msg, "base64.txt")
             except Exception as e:
                 logging.exception("Exception occurred")
                 await ctx.reply(
@@ -416,8 +968,7 @@ class Miscellaneous(commands.Cog):
                 )
         elif method[0] == "d":
             try:
-                base64_decoded = base64.b64decode(msg).decode()
-                await ctx.reply(f"```{base64_decoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, ["b64d"], msg, "base64.txt")
             except Exception as e:
                 logging.exception("Exception occurred")
                 await ctx.reply(
@@ -429,16 +980,17 @@ class Miscellaneous(commands.Cog):
             )
 
     @commands.command("base32", aliases=["b32"])
-    async def base32(self, ctx, method, *, msg):
+    async def base32(self, ctx, method, *, msg=""):
         """
         Encode or decode in base32.
         Usage: base32 [e|d] message.
         For method use "e" for encoding and "d" for decoding
         """
+        if await missing_input(ctx, msg):
+            return
         if method[0] == "e":
             try:
-                base32_encoded = base64.b32encode(msg.encode()).decode()
-                await ctx.reply(f"```{base32_encoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, ["b32e"], msg, "base32.txt")
             except Exception as e:
                 logging.exception("Exception occurred")
                 await ctx.reply(
@@ -446,8 +998,7 @@ class Miscellaneous(commands.Cog):
                 )
         elif method[0] == "d":
             try:
-                base32_decoded = base64.b32decode(msg).decode()
-                await ctx.reply(f"```{base32_decoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, ["b32d"], msg, "base32.txt")
             except Exception as e:
                 logging.exception("Exception occurred")
                 await ctx.reply(
@@ -467,7 +1018,7 @@ class Miscellaneous(commands.Cog):
         await ctx.reply(random.choice(coin_faces), delete_after=delete_seconds)
 
     @commands.command("poll")
-    async def poll(self, ctx, title, *, options):
+    async def poll(self, ctx, title, *options):
         """
         Create a poll. (maximum 9 options)
         Usage: /poll "question" "1st option" "2nd option"...
@@ -492,25 +1043,51 @@ class Miscellaneous(commands.Cog):
                 timestamp=datetime.datetime.utcnow(),
             )
             embed.set_footer(text=f"Poll by {ctx.author.name}")
-            embed.set_thumbnail(url=ctx.author.avatar_url)
+            embed.set_thumbnail(url=ctx.author.display_avatar.url)
             msg = await ctx.send(embed=embed)
+            polls.add(msg, title, dict(zip(reactions, options)))
             for reaction in reactions:
                 try:
                     await msg.add_reaction(reaction)
                 except Exception as e:
                     logging.exception("Exception occurred")
 
+    @commands.command("poll-results")
+    async def poll_results(self, ctx, message_id: int):
+        """
+        Shows the votes of a poll.
+        Usage: /poll-results message_id
+        """
+        poll = polls.get(message_id)
+        if poll is None:
+            return await ctx.reply(
+                "Sorry I don't know a poll with that id.", delete_after=delete_seconds
+            )
+
+        votes = sorted(poll["votes"].items(), key=lambda vote: vote[1], reverse=True)
+        description = ""
+        for emoji, count in votes:
+            description += f"{emoji} - {poll['options'][emoji]}: **{count}**\n"
+        embed = discord.Embed(
+            title=poll["title"],
+            description=description,
+            color=discord.Colour.blue(),
+            timestamp=datetime.datetime.utcnow(),
+        )
+        await ctx.reply(embed=embed, delete_after=delete_seconds)
+
     @commands.command("url")
-    async def url(self, ctx, method, *, msg):
+    async def url(self, ctx, method, *, msg=""):
         """
         Encode or decode in URL format.
         Usage: url [e|d] message.
         For method use "e" for encoding and "d" for decoding
         """
+        if await missing_input(ctx, msg):
+            return
         if method[0] == "e":
             try:
-                url_encoded = quote(msg)
-                await ctx.reply(f"```{url_encoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, ["urle"], msg, "url.txt")
             except Exception as e:
                 logging.exception("Exception occurred")
                 await ctx.reply(
@@ -518,8 +1095,7 @@ class Miscellaneous(commands.Cog):
                 )
         elif method[0] == "d":
             try:
-                url_decoded = unquote(msg)
-                await ctx.reply(f"```{url_decoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, ["urld"], msg, "url.txt")
             except Exception as e:
                 logging.exception("Exception occurred")
                 await ctx.reply(
@@ -531,16 +1107,19 @@ class Miscellaneous(commands.Cog):
             )
 
     @commands.command("binary")
-    async def binary(self, ctx, method, *, msg):
+    async def binary(self, ctx, method, *, msg=""):
         """
         Encode or decode in binary.
-        Usage: binary [e|d] message.
-        For method use "e" for encoding and "d" for decoding
+        Usage: binary [e|d|e7|d7] message.
+        For method use "e" for encoding and "d" for decoding, add a 7 for
+        7 bits per character
         """
+        if await missing_input(ctx, msg):
+            return
+        width = "7" if method.endswith("7") else ""
         if method[0] == "e":
             try:
-                binary_encoded = "".join(format(ord(i), "08b") for i in msg)
-                await ctx.reply(f"```{binary_encoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, [f"bine{width}"], msg, "binary.txt")
             except Exception as e:
                 logging.exception("Exception occurred")
                 await ctx.reply(
@@ -548,10 +1127,7 @@ class Miscellaneous(commands.Cog):
                 )
         elif method[0] == "d":
             try:
-                binary_int = int(msg, 2)
-                byte_number = binary_int.bit_length() + 7 // 8
-                binary_decoded = binary_int.to_bytes(byte_number, "big").decode()
-                await ctx.reply(f"```{binary_decoded}```", delete_after=delete_seconds)
+                await transform_reply(ctx, [f"bind{width}"], msg, "binary.txt")
             except ValueError:
                 await ctx.reply(
                     "Please supply a valid binary value to decode.",
@@ -567,13 +1143,67 @@ class Miscellaneous(commands.Cog):
                 f"{method} is not a valid option", delete_after=delete_seconds
             )
 
+    @commands.command("octal", aliases=["oct"])
+    async def octal(self, ctx, method, *, msg=""):
+        """
+        Encode or decode bytes as a list of octal numbers.
+        Usage: octal [e|d] message.
+        For method use "e" for encoding and "d" for decoding
+        """
+        if await missing_input(ctx, msg):
+            return
+        if method[0] not in "ed":
+            return await ctx.reply(
+                f"{method} is not a valid option", delete_after=delete_seconds
+            )
+        try:
+            await transform_reply(ctx, [f"oct{method[0]}"], msg, "octal.txt")
+        except ValueError:
+            await ctx.reply(
+                "Please supply valid octal byte values to decode.",
+                delete_after=delete_seconds,
+            )
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
+    @commands.command("decimal", aliases=["dec"])
+    async def decimal(self, ctx, method, *, msg=""):
+        """
+        Encode or decode bytes as a list of decimal numbers.
+        Usage: decimal [e|d] message.
+        For method use "e" for encoding and "d" for decoding
+        """
+        if await missing_input(ctx, msg):
+            return
+        if method[0] not in "ed":
+            return await ctx.reply(
+                f"{method} is not a valid option", delete_after=delete_seconds
+            )
+        try:
+            await transform_reply(ctx, [f"dec{method[0]}"], msg, "decimal.txt")
+        except ValueError:
+            await ctx.reply(
+                "Please supply valid decimal byte values to decode.",
+                delete_after=delete_seconds,
+            )
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply(
+                "Sorry something went wrong :(", delete_after=delete_seconds
+            )
+
     @commands.command("reverse", aliases=["rev"])
-    async def reverse(self, ctx, *, text):
+    async def reverse(self, ctx, *, text=""):
         """
         Reverses the message.
         """
+        if await missing_input(ctx, text):
+            return
         try:
-            await ctx.reply(text[::-1], delete_after=delete_seconds)
+            await transform_reply(ctx, ["reverse"], text, "reverse.txt")
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply(
@@ -593,20 +1223,36 @@ class Miscellaneous(commands.Cog):
                 "Sorry something went wrong :(", delete_after=delete_seconds
             )
 
-    @commands.command("counteach")
-    async def counteach(self, ctx, *, text):
+    @commands.command("counteach", aliases=["freq"])
+    async def counteach(self, ctx, *, text=""):
         """
-        Counts the amount of characters in a text.
+        Byte, bigram and trigram frequencies, entropy and index of
+        coincidence of the message or attachment.
+        Usage: counteach [--csv] message.
+        With --csv every n-gram count comes back as a csv file
         """
         try:
-            count = {}
-            for char in text:
-                if char in count:
-                    count[char] += 1
-                else:
-                    count[char] = 1
-
-            await ctx.reply(str(count), delete_after=delete_seconds)
+            as_csv = text.startswith("--csv")
+            if as_csv:
+                text = text[len("--csv"):].strip()
+            if await missing_input(ctx, text):
+                return
+            # Counted chunk by chunk as the attachment streams in
+            counter = NgramCounter()
+            async for chunk in read_input(ctx, text):
+                await asyncio.to_thread(counter.feed, chunk)
+            top = csv_ngrams if as_csv else table_ngrams
+            stats = await asyncio.to_thread(counter.stats, top)
+
+            if as_csv:
+                await ctx.reply(
+                    file=discord.File(
+                        io.BytesIO(to_csv(stats).encode()), filename="counteach.csv"
+                    ),
+                    delete_after=delete_seconds,
+                )
+            else:
+                await reply_text(ctx, table(stats), "counteach.txt")
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply(
@@ -616,7 +1262,7 @@ class Miscellaneous(commands.Cog):
     @commands.command("chat")
     async def chat(self, ctx, *, text):
         try:
-            response = chatbot(ctx.author.name, text)
+            response = await chatbot(ctx.author.name, text)
             await ctx.reply(response, delete_after=delete_seconds)
         except Exception as e:
             logging.exception("Exception occurred")
@@ -628,35 +1274,99 @@ class Miscellaneous(commands.Cog):
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.playing = False
-        self.queue = []
-        self.paused = False
+        self.players = {}
 
-    async def check_queue(self, ctx):
-        if self.paused:
+    def get_player(self, guild):
+        player = self.players.get(guild.id)
+        if player is None:
+            player = self.players[guild.id] = GuildPlayer(guild.id)
+        return player
+
+    async def play_next(self, ctx):
+        player = self.get_player(ctx.guild)
+        if player.paused or player.voice_client is None:
             return
 
-        if self.queue:
-            voice_client = discord.utils.get(bot.voice_clients, guild=ctx.guild)
-            voice_client.stop()
-            self.queue.pop(0)
-            if self.queue:
-                await ctx.invoke(self.bot.get_command("play"), url=self.queue[0][1])
-
-    def _play(self, url, *args):
-        if url:
-            out = False
-            url = url.strip() + " " + " ".join(args)
-            url = url.strip()
-            url = get_youtube_audio(url)
-            self.queue.append(url)
-            out = f'The Song "{url.get("title")}"'
-
-            return out
-        else:
-            lofi = get_youtube_audio(url)
-            self.queue.append(lofi)
-            return f'The song {lofi.get("title")}'
+        song_info = player.dequeue()
+        source = player.take_prefetched(song_info)
+        player.cancel_prefetch()
+        if song_info is None:
+            return
+
+        try:
+            if source is None:
+                playable = await self.prepare(song_info)
+                source = MeteredSource.from_track(playable, player.volume)
+            player.voice_client.play(
+                source,
+                after=lambda error: asyncio.run_coroutine_threadsafe(
+                    self.play_next(ctx), self.bot.loop
+                ),
+            )
+            player.start_playing()
+            if audio_cache is not None:
+                audio_cache.record_play(song_info)
+            self.start_prefetch(player)
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.send(
+                f'Sorry, couldn\'t play "{song_info.get("title")}" :(',
+                delete_after=delete_seconds,
+            )
+            return await self.play_next(ctx)
+
+        embed = discord.Embed(
+            title="Now playing",
+            color=discord.Color.green(),
+            timestamp=datetime.datetime.utcnow(),
+        )
+        embed.set_author(name=f"Requested by {ctx.author.display_name}")
+        embed.set_footer(text="Playback Information")
+        embed.add_field(name="Title", value=song_info["title"])
+        embed.add_field(name="Artist", value=song_info["artist"])
+        embed.set_image(url=song_info["thumbnail"])
+        await ctx.send(embed=embed, delete_after=delete_seconds)
+
+    async def prepare(self, track):
+        """
+        The track to build a source from, a local copy when it's cached.
+        """
+        local = audio_cache and audio_cache.get(track)
+        if local:
+            return local
+        return await track_resolver.resolve_stream(track)
+
+    def start_prefetch(self, player):
+        if player.queue and (player.prefetch_task is None or player.prefetch_task.done()):
+            player.prefetch_task = asyncio.create_task(self.prefetch(player))
+
+    async def prefetch(self, player):
+        """
+        Resolve the next song right away and spawn its source shortly before
+        the current one ends, so play_next only has to swap sources.
+        """
+        track = player.queue[0]
+        try:
+            playable = await self.prepare(track)
+            # Counted from what's left of the current song, which may have
+            # been playing for a while or be paused
+            while True:
+                remaining = player.remaining()
+                if remaining is None or remaining <= prebuffer_seconds:
+                    break
+                await asyncio.sleep(remaining - prebuffer_seconds)
+            if player.queue and player.queue[0] is track:
+                player.set_prefetched(
+                    track, MeteredSource.from_track(playable, player.volume)
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.exception("Exception occurred")
+
+    async def _play(self, url, *args):
+        url = " ".join((url or lofi_query, *args)).strip()
+        return await track_resolver.resolve(url)
 
     @commands.command("play")
     async def play(self, ctx, url=None, *args):
@@ -664,61 +1374,143 @@ class Music(commands.Cog):
         Plays music in the Music channel.
         """
         try:
-            voice = discord.utils.get(ctx.guild.voice_channels, name="Music")
+            player = self.get_player(ctx.guild)
             voice_client = discord.utils.get(bot.voice_clients, guild=ctx.guild)
 
             if voice_client == None:
-                await voice.connect()
-                voice_client = discord.utils.get(bot.voice_clients, guild=ctx.guild)
-
-            embed = discord.Embed(
-                title="Now playing",
-                color=discord.Color.green(),
-                timestamp=datetime.datetime.utcnow(),
-            )
-            embed.set_author(name=f"Requested by {ctx.author.display_name}")
-            embed.set_footer(text="Playback Information")
+                voice = discord.utils.get(ctx.guild.voice_channels, name="Music")
+                voice_client = await voice.connect()
+            player.voice_client = voice_client
 
-            can_play = self._play(url, *args)
-
-            if voice_client.is_playing():
+            tracks = await self._play(url, *args)
+            if not tracks:
                 await ctx.reply(
-                    f"{can_play} was added to the queue", delete_after=delete_seconds
+                    "Please input a valid youtube URL for playing audio",
+                    delete_after=delete_seconds,
                 )
                 return
 
-            if can_play:
-                song_info = self.queue[0]
-                song = song_info["url"]
-                embed.add_field(name="Title", value=song_info["title"])
-                embed.add_field(name="Artist", value=song_info["artist"])
-                embed.set_image(url=song_info["thumbnail"])
-               
-                player = await YTDLSource.from_url(song_info["url"], loop=self.bot.loop, stream=True)
-                voice_client.play(player, after=lambda error: self.bot.loop.create_task(
-                        self.check_queue(ctx)
-                    )) 
-                self.playing = True
-            else:
+            player.enqueue_many(tracks)
+            if player.current is not None:
+                self.start_prefetch(player)
+                if len(tracks) == 1:
+                    added = f'The Song "{tracks[0].get("title")}" was'
+                else:
+                    added = f"{len(tracks)} songs were"
                 await ctx.reply(
-                    "Please input a valid youtube URL for playing audio",
-                    delete_after=delete_seconds,
+                    f"{added} added to the queue", delete_after=delete_seconds
                 )
                 return
 
-            await ctx.send(embed=embed, delete_after=delete_seconds)
+            await self.play_next(ctx)
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply(
                 "Sorry something went wrong :(", delete_after=delete_seconds
             )
 
+    @commands.command("music-stats")
+    async def music_stats(self, ctx):
+        """
+        Shows track cache statistics.
+        """
+        stats = track_cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups * 100 if lookups else 0
+        out = (
+            f"Cached tracks: {stats['tracks']} ({stats['queries']} searches)\n"
+            f"Lookups: {stats['hits']} hits / {stats['misses']} misses ({hit_rate:.0f}%)\n"
+            f"Stream urls: {stats['stream_hits']} reused / {stats['stream_misses']} expired"
+        )
+        if audio_cache is not None:
+            stats = audio_cache.stats()
+            out += (
+                f"\nLocal audio: {stats['files']} songs, {stats['bytes'] / 1024**2:.0f} MB"
+                f" ({stats['downloading']} downloading)"
+            )
+
+        voice = discord.utils.get(bot.voice_clients, guild=ctx.guild)
+        source = voice and voice.source
+        if isinstance(source, MeteredSource) and source.seconds:
+            out += (
+                f"\n\nNow playing: {source.title} ({source.mode})\n"
+                f"Player CPU: {source.cpu_time / source.seconds * 100:.2f}% of a core"
+            )
+            ffmpeg_cpu = source.ffmpeg_cpu_time
+            if ffmpeg_cpu is not None:
+                out += f"\nffmpeg CPU: {ffmpeg_cpu / source.seconds * 100:.2f}% of a core"
+        await ctx.reply(f"```{out}```", delete_after=delete_seconds)
+
+    @commands.command("volume", aliases=["vol"])
+    async def volume(self, ctx, percent: int = None):
+        """
+        Shows or sets the volume in percent. At 100 the audio isn't touched.
+        """
+        player = self.get_player(ctx.guild)
+        if percent is None:
+            return await ctx.reply(
+                f"The volume is {player.volume * 100:.0f}%", delete_after=delete_seconds
+            )
+
+        player.volume = max(0, min(percent, 200)) / 100
+        voice = discord.utils.get(bot.voice_clients, guild=ctx.guild)
+        source = voice and voice.source
+        if isinstance(source, MeteredSource) and source.mode == "pcm+volume":
+            source.original.volume = player.volume
+            await ctx.reply(
+                f"The volume is now {player.volume * 100:.0f}%",
+                delete_after=delete_seconds,
+            )
+        else:
+            await ctx.reply(
+                f"The volume will be {player.volume * 100:.0f}% from the next song",
+                delete_after=delete_seconds,
+            )
+
+    @commands.command("queue")
+    async def queue(self, ctx):
+        """
+        Shows the songs queued in this server.
+        """
+        player = self.get_player(ctx.guild)
+        if player.current is None and not player.queue:
+            return await ctx.reply("The queue is empty.", delete_after=delete_seconds)
+
+        lines = []
+        if player.current is not None:
+            lines.append(f'Now playing: {player.current.get("title")}')
+        for i, song_info in enumerate(itertools.islice(player.queue, 10)):
+            lines.append(f'{i+1}) {song_info.get("title")}')
+        if len(player) > 10:
+            lines.append(f"... and {len(player) - 10} more")
+        await ctx.reply("\n".join(lines), delete_after=delete_seconds)
+
+    @commands.command("skip")
+    async def skip(self, ctx):
+        """
+        Skips the currently playing song.
+        """
+        try:
+            player = self.get_player(ctx.guild)
+            if player.is_active:
+                player.paused = False
+                player.skip()
+            else:
+                await ctx.reply(
+                    "Currently no audio is playing.", delete_after=delete_seconds
+                )
+        except Exception as e:
+            logging.exception("Exception occurred")
+            await ctx.reply("Sorry something wen wrong :(", delete_after=delete_seconds)
+
     @commands.command("leave")
     async def leave(self, ctx):
         """
         Stops currently playing music and leave from the Music channel.
         """
-        self.queue = []
+        player = self.players.pop(ctx.guild.id, None)
+        if player is not None:
+            player.clear()
         try:
             voice = discord.utils.get(bot.voice_clients, guild=ctx.guild)
             try:
@@ -738,7 +1530,7 @@ class Music(commands.Cog):
             voice = discord.utils.get(bot.voice_clients, guild=ctx.guild)
             if voice.is_playing():
                 voice.pause()
-                self.paused = True
+                self.get_player(ctx.guild).pause()
             else:
                 await ctx.reply(
                     "Currently no audio is playing.", delete_after=delete_seconds
@@ -756,7 +1548,7 @@ class Music(commands.Cog):
             voice = discord.utils.get(bot.voice_clients, guild=ctx.guild)
             if voice.is_paused():
                 voice.resume()
-                self.paused = False
+                self.get_player(ctx.guild).resume()
             else:
                 await ctx.reply("The audio is not paused.", delete_after=delete_seconds)
         except Exception as e:
@@ -769,9 +1561,10 @@ class Music(commands.Cog):
         Stops currently playing music in the Music channel.
         """
         try:
+            player = self.get_player(ctx.guild)
+            player.clear()
             voice = discord.utils.get(bot.voice_clients, guild=ctx.guild)
             voice.stop()
-            self.queue = []
         except Exception as e:
             logging.exception("Exception occurred")
             await ctx.reply("Sorry something wen wrong :(", delete_after=delete_seconds)
@@ -786,13 +1579,18 @@ class Quiz(commands.Cog):
             "medium": discord.Color.gold(),
             "hard": discord.Color.red(),
         }
-        self.have_a_quiz = False
+        self.questions = QuestionBuffer(
+            http_client, self.quiz_api, batch_size=50, params={"type": "multiple"}
+        )
+        # channel id -> id of the user the running quiz belongs to
+        self.sessions = {}
 
-    def get_random_quiz(self):
-        data = requests.get(
-            self.quiz_api, params={"amount": 1, "type": "multiple"}
-        ).json()
-        result = data.get("results")[0]
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.questions.refill_soon()
+
+    async def get_random_quiz(self):
+        result = await self.questions.get()
         category = result.get("category")
         difficulty = result.get("difficulty")
         question = html.unescape(result.get("question"))
@@ -808,47 +1606,57 @@ class Quiz(commands.Cog):
         return category, difficulty, qs, answer_num, answer
 
     @commands.command("quiz")
+    @admission()
     async def quiz(self, ctx):
         """
         Asks you a random question. You can answer with the number corresponding to the answer.
         """
-        if self.have_a_quiz:
-            return await ctx.reply("You can't have 2 quizes at a time.")
-
         message = ctx.message
-        category, difficulty, qs, ans_num, ans = self.get_random_quiz()
-        color = self.difficulty_colors.get(difficulty.lower(), discord.Color.blue())
+        if message.channel.id in self.sessions:
+            return await ctx.reply(
+                "You can't have 2 quizes at a time in a channel.",
+                delete_after=delete_seconds,
+            )
 
-        embed = discord.Embed(
-            title=f"Quiz about {category}",
-            description=qs,
-            color=color,
-            timestamp=datetime.datetime.utcnow(),
-        )
+        self.sessions[message.channel.id] = message.author.id
+        try:
+            category, difficulty, qs, ans_num, ans = await self.get_random_quiz()
+            color = self.difficulty_colors.get(difficulty.lower(), discord.Color.blue())
 
-        await message.channel.send(embed=embed, delete_after=delete_seconds)
-        self.have_a_quiz = True
+            embed = discord.Embed(
+                title=f"Quiz about {category}",
+                description=qs,
+                color=color,
+                timestamp=datetime.datetime.utcnow(),
+            )
 
-        def check(m):
-            return m.author == message.author and m.content.isdigit()
+            await ctx.send(embed=embed, delete_after=delete_seconds)
 
-        try:
-            guess = await self.bot.wait_for(
-                "message", check=check, timeout=delete_seconds
-            )
-        except asyncio.TimeoutError:
-            return await ctx.reply(
-                "Sorry you took a long time to respond", delete_after=delete_seconds
-            )
+            def check(m):
+                return (
+                    m.channel == message.channel
+                    and m.author == message.author
+                    and m.content.isdigit()
+                )
 
-        if int(guess.content) == ans_num:
-            await ctx.send("You are right!", delete_after=delete_seconds)
-        else:
-            await ctx.send(
-                f'That\'s incorrect! The correct answer was "{ans}"',
-                delete_after=delete_seconds,
-            )
-        self.have_a_quiz = False
+            try:
+                guess = await self.bot.wait_for(
+                    "message", check=check, timeout=delete_seconds
+                )
+            except asyncio.TimeoutError:
+                return await ctx.reply(
+                    "Sorry you took a long time to respond", delete_after=delete_seconds
+                )
+
+            if int(guess.content) == ans_num:
+                await ctx.send("You are right!", delete_after=delete_seconds)
+            else:
+                await ctx.send(
+                    f'That\'s incorrect! The correct answer was "{ans}"',
+                    delete_after=delete_seconds,
+                )
+        finally:
+            del self.sessions[message.channel.id]
 
 
 bot.add_cog(CTF(bot))
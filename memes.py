@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import random
+from collections import deque
+
+
+class MemePool:
+    """
+    Background filled pool of SFW reddit posts.
+    Posts are filtered and de-duplicated once when a page is fetched, so
+    handing one out is a plain O(1) pop. Below `low_water` the pool is refilled
+    in bulk, following reddit's `after` cursor, and a post is not handed out
+    again until `repeat_window` other posts have been shown.
+    """
+
+    def __init__(
+        self,
+        http_client,
+        url,
+        *,
+        page_size=100,
+        low_water=20,
+        high_water=150,
+        repeat_window=500,
+        max_pages=5,
+    ):
+        self.http_client = http_client
+        self.url = url
+        self.page_size = page_size
+        self.low_water = low_water
+        self.high_water = high_water
+        self.max_pages = max_pages
+
+        self.pool = deque()
+        self.after = None
+        self._pooled = set()
+        self._recent = deque(maxlen=repeat_window)
+        self._recent_ids = set()
+        self._refill_task = None
+
+    def __len__(self):
+        return len(self.pool)
+
+    async def get(self):
+        if not self.pool:
+            await self.refill_soon()
+        if not self.pool:
+            raise LookupError("No memes available")
+
+        post = self.pool.popleft()
+        self._pooled.discard(post["id"])
+        self._remember(post["id"])
+
+        if len(self.pool) < self.low_water:
+            self.refill_soon()
+        return post["url"], post["title"], post["permalink"]
+
+    def refill_soon(self):
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self.refill())
+        return self._refill_task
+
+    async def refill(self):
+        for _ in range(self.max_pages):
+            if len(self.pool) >= self.high_water:
+                break
+            try:
+                listing = await self.http_client.get_json(
+                    self.url, params={"limit": self.page_size, "after": self.after or ""}
+                )
+            except Exception:
+                logging.exception("Refilling the meme pool failed")
+                break
+
+            data = listing.get("data", {})
+            fresh = [post for post in map(self._parse, data.get("children", [])) if post]
+            random.shuffle(fresh)
+            self.pool.extend(fresh)
+
+            # Wrap around to the front page once the listing runs out
+            self.after = data.get("after")
+            if not self.after:
+                break
+
+    def _parse(self, child):
+        post = child.get("data", {})
+        post_id = post.get("id")
+        if not post_id or post.get("over_18") or post.get("stickied"):
+            return None
+        if post_id in self._pooled or post_id in self._recent_ids:
+            return None
+
+        self._pooled.add(post_id)
+        return {
+            "id": post_id,
+            "url": post.get("url", ""),
+            "title": post.get("title", "**Joke**"),
+            "permalink": post.get("permalink", ""),
+        }
+
+    def _remember(self, post_id):
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_ids.discard(self._recent[0])
+        self._recent.append(post_id)
+        self._recent_ids.add(post_id)
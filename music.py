@@ -1,4 +1,10 @@
 import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
 
 import discord
 import yt_dlp as youtube_dl
@@ -27,27 +33,337 @@ ffmpeg_options = {
     'options': '-vn',
 }
 
-ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+# Let ffmpeg reconnect to dropped http streams instead of ending the song
+stream_ffmpeg_options = {
+    **ffmpeg_options,
+    'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+}
+
+playlist_options = {
+    **ytdl_format_options,
+    'noplaylist': False,
+    'extract_flat': 'in_playlist',
+}
+
+
+def is_url(query):
+    parsed = urlparse(query)
+    return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+
+
+def is_playlist(url):
+    parsed = urlparse(url)
+    return parsed.path.rstrip("/").endswith("/playlist") or (
+        "list" in parse_qs(parsed.query) and "v" not in parse_qs(parsed.query)
+    )
+
+
+def ffmpeg_options_for(source):
+    return stream_ffmpeg_options if is_url(source) else ffmpeg_options
+
+
+def track_from_info(data):
+    """
+    The bits of yt-dlp's info dict the bot needs, for display and playback.
+    """
+    video_id = data.get("id")
+    return {
+        "id": video_id,
+        "title": data.get("title", ""),
+        "thumbnail": data.get("thumbnail", ""),
+        "artist": data.get("channel") or data.get("uploader", ""),
+        "url": data.get("webpage_url") or f"https://youtube.com/watch?v={video_id}",
+        "duration": data.get("duration"),
+        # Flat playlist entries don't carry a stream url yet
+        "stream_url": data.get("url") if data.get("_type") != "url" else None,
+        "acodec": data.get("acodec"),
+        "ext": data.get("ext"),
+    }
+
+
+class TrackResolver:
+    """
+    Resolves queries and urls to tracks with a single yt-dlp extraction.
+    Extraction runs on a bounded thread pool, every worker thread reuses its
+    own YoutubeDL instances (they aren't safe to share between threads).
+    """
+
+    def __init__(self, max_workers=4, cache=None):
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ytdl"
+        )
+        self._local = threading.local()
+
+    def _ytdl(self, playlist=False):
+        name = "playlist" if playlist else "single"
+        ydl = getattr(self._local, name, None)
+        if ydl is None:
+            ydl = youtube_dl.YoutubeDL(playlist_options if playlist else ytdl_format_options)
+            setattr(self._local, name, ydl)
+        return ydl
+
+    def _extract(self, query):
+        if self.cache is None or is_playlist(query):
+            return self._extract_uncached(query)
+
+        track = self.cache.get(query)
+        if track is not None and track["stream_url"]:
+            return [track]
+        if track is not None and not is_url(query):
+            # Known search, the stream url is fetched through the video url later
+            return [track]
+
+        tracks = self._extract_uncached(query)
+        for track in tracks:
+            self.cache.put(query, track)
+        return tracks
+
+    def _extract_uncached(self, query):
+        if not is_url(query):
+            data = self._ytdl().extract_info(f"ytsearch1:{query}", download=False)
+            entries = data.get("entries") or []
+            return [track_from_info(entries[0])] if entries else []
+
+        if is_playlist(query):
+            data = self._ytdl(playlist=True).extract_info(query, download=False)
+            return [track_from_info(entry) for entry in data.get("entries") or [] if entry]
+
+        data = self._ytdl().extract_info(query, download=False)
+        if "entries" in data:
+            # take first item from a playlist
+            data = data["entries"][0]
+        return [track_from_info(data)]
+
+    async def resolve(self, query):
+        """
+        Returns the list of tracks for a search, video or playlist url.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._extract, query)
+
+    async def resolve_stream(self, track):
+        """
+        Fills in the stream url of a track that doesn't have one yet.
+        """
+        if track.get("stream_url"):
+            return track
+        tracks = await self.resolve(track["url"])
+        if not tracks:
+            raise LookupError(f"Couldn't resolve {track['url']}")
+        track.update(tracks[0])
+        return track
+
+
+# Volume at which sources are played without touching the audio in Python
+default_volume = 1.0
+
 
 class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
+    def __init__(self, source, *, data, volume=default_volume):
         super().__init__(source, volume)
 
         self.data = data
 
         self.title = data.get('title')
-        self.url = data.get('url')
+        self.url = data.get('stream_url')
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=False):
-        loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
+    def from_track(cls, track, volume=default_volume):
+        return cls(
+            discord.FFmpegPCMAudio(
+                track['stream_url'], **ffmpeg_options_for(track['stream_url'])
+            ),
+            data=track,
+            volume=volume,
+        )
 
-        if 'entries' in data:
-            # take first item from a playlist
-            data = data['entries'][0]
 
-        filename = data['url'] if stream else ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+def is_opus(track):
+    return track.get("acodec") == "opus" and track.get("ext") in ("webm", "opus")
+
+
+class MeteredSource(discord.AudioSource):
+    """
+    Wraps a source to measure what it costs to play.
+    `cpu_time` is the CPU time of the voice player thread (reading, volume
+    scaling and Opus encoding) and `ffmpeg_cpu_time` that of the ffmpeg process.
+    """
+
+    def __init__(self, original, *, data, mode):
+        self.original = original
+        self.data = data
+        self.mode = mode
+        self.title = data.get("title")
+        self.frames = 0
+        self.cpu_time = 0.0
+        self._last_read = None
+
+    @classmethod
+    def from_track(cls, track, volume=default_volume):
+        """
+        Opus streams are passed through as is, other codecs are encoded to Opus
+        by ffmpeg. Only a non default volume decodes to PCM and scales in Python.
+        """
+        options = ffmpeg_options_for(track["stream_url"])
+        if volume != default_volume:
+            source = YTDLSource.from_track(track, volume)
+            mode = "pcm+volume"
+        elif is_opus(track):
+            source = discord.FFmpegOpusAudio(track["stream_url"], codec="copy", **options)
+            mode = "opus passthrough"
+        else:
+            source = discord.FFmpegOpusAudio(track["stream_url"], **options)
+            mode = "ffmpeg opus"
+        return cls(source, data=track, mode=mode)
+
+    @property
+    def volume(self):
+        return getattr(self.original, "volume", default_volume)
+
+    @property
+    def seconds(self):
+        # Every frame is 20ms of audio
+        return self.frames * 0.02
+
+    @property
+    def ffmpeg_cpu_time(self):
+        process = getattr(self.original, "_process", None)
+        if isinstance(self.original, discord.PCMVolumeTransformer):
+            process = getattr(self.original.original, "_process", None)
+        if process is None:
+            return None
+        try:
+            with open(f"/proc/{process.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        # utime and stime, fields 14 and 15 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def read(self):
+        now = time.thread_time()
+        if self._last_read is not None:
+            self.cpu_time += now - self._last_read
+        self._last_read = now
+
+        data = self.original.read()
+        if data:
+            self.frames += 1
+        return data
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        self.original.cleanup()
+
+
+class GuildPlayer:
+    """
+    Playback state of a single guild: its voice client, the track that is
+    playing and a deque of the tracks queued after it.
+    """
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.voice_client = None
+        self.current = None
+        self.paused = False
+        # monotonic() the current track started and the time it spent paused
+        self.started_at = None
+        self.paused_at = None
+        self.paused_for = 0.0
+        self.volume = default_volume
+        self.queue = deque()
+        # (track, source) of the next song, spawned while the current one plays
+        self.prefetched = None
+        self.prefetch_task = None
+
+    def __len__(self):
+        return len(self.queue)
+
+    @property
+    def is_active(self):
+        return self.voice_client is not None and (
+            self.voice_client.is_playing() or self.voice_client.is_paused()
+        )
+
+    def enqueue(self, track):
+        self.queue.append(track)
+
+    def enqueue_many(self, tracks):
+        self.queue.extend(tracks)
+
+    def dequeue(self):
+        self.current = self.queue.popleft() if self.queue else None
+        return self.current
+
+    def start_playing(self):
+        self.started_at = time.monotonic()
+        self.paused_at = None
+        self.paused_for = 0.0
+
+    def pause(self):
+        self.paused = True
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def resume(self):
+        self.paused = False
+        if self.paused_at is not None:
+            self.paused_for += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def remaining(self):
+        """
+        Seconds of the current track left to play, None if that's unknown.
+        """
+        duration = self.current and self.current.get("duration")
+        if not duration or self.started_at is None:
+            return None
+        now = self.paused_at or time.monotonic()
+        return max(0.0, duration - (now - self.started_at - self.paused_for))
+
+    def skip(self):
+        """
+        Stop the current track, the `after` callback moves on to the next one.
+        """
+        if self.voice_client is not None:
+            self.voice_client.stop()
+
+    def set_prefetched(self, track, source):
+        self.discard_prefetched()
+        self.prefetched = (track, source)
+
+    def take_prefetched(self, track):
+        """
+        The source prefetched for `track` or None if there is no usable one.
+        """
+        prefetched, self.prefetched = self.prefetched, None
+        if prefetched is None:
+            return None
+        prefetched_track, source = prefetched
+        if prefetched_track is track and source.volume == self.volume:
+            return source
+        source.cleanup()
+        return None
+
+    def discard_prefetched(self):
+        if self.prefetched is not None:
+            self.prefetched[1].cleanup()
+            self.prefetched = None
 
+    def cancel_prefetch(self):
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+        self.discard_prefetched()
 
+    def clear(self):
+        self.cancel_prefetch()
+        self.queue.clear()
+        self.current = None
+        self.paused = False
+        self.started_at = None
+        self.paused_at = None
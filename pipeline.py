@@ -0,0 +1,185 @@
+"""
+Streaming chains of the transforms codecs, used by /pipe.
+"""
+import re
+
+import transforms
+
+step_re = re.compile(r"\s*([\w-]+)\s*(\|?)")
+last_separator_re = re.compile(rb"[\s,](?=[^\s,]*$)")
+
+
+class Stage:
+    """
+    Runs `func` over the data as it comes in, `block` bytes at a time.
+    Leftover bytes that don't fill a block wait for the next chunk and go
+    through `func` on their own when the stream ends.
+    """
+
+    def __init__(self, func, block=1, strip=False):
+        self.func = func
+        self.block = block
+        self.strip = strip
+        self.buffer = b""
+
+    def feed(self, data):
+        if self.strip:
+            data = transforms.whitespace_re.sub(b"", data)
+        data = self.buffer + data
+        cut = len(data) - self.split(data)
+        self.buffer = data[cut:]
+        return self.apply(data[:cut]) if cut else b""
+
+    def split(self, data):
+        """
+        How many bytes at the end of `data` have to wait for more input.
+        """
+        return len(data) % self.block
+
+    def apply(self, data):
+        return self.func(data)
+
+    def flush(self):
+        data, self.buffer = self.buffer, b""
+        return self.func(data) if data else b""
+
+
+class GroupDecode(Stage):
+    """
+    Decoder of separated groups (bits or byte values), chunks are cut after
+    the last separator so no group is split. Without any separator the cut
+    is made at a multiple of `block`, or with no `block` (byte values, whose
+    digits can't be cut anywhere) everything waits for a separator or flush().
+    """
+
+    def split(self, data):
+        match = last_separator_re.search(data)
+        if match:
+            return len(data) - match.end()
+        return len(data) % self.block if self.block else len(data)
+
+
+class NumberEncode(Stage):
+    """
+    Keeps the space between the byte values of consecutive chunks.
+    """
+
+    def __init__(self, func):
+        super().__init__(func)
+        self.started = False
+
+    def apply(self, data):
+        out = self.func(data)
+        if self.started:
+            out = b" " + out
+        self.started = True
+        return out
+
+
+class UrlDecode(Stage):
+    def __init__(self):
+        super().__init__(transforms.urld)
+
+    def split(self, data):
+        # Keep a %XX escape cut off at the end of the chunk together
+        tail = data[-2:]
+        return len(tail) - tail.index(b"%") if b"%" in tail else 0
+
+
+class Whole(Stage):
+    """
+    Stage that needs the whole input at once, like reverse.
+    """
+
+    def __init__(self, func):
+        super().__init__(func)
+        self.chunks = []
+
+    def feed(self, data):
+        # Joined once in flush(), adding to a bytes buffer copies all of it every chunk
+        self.chunks.append(data)
+        return b""
+
+    def flush(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return self.func(data) if data else b""
+
+
+stages = {
+    "b64e": lambda: Stage(transforms.b64e, 3),
+    "b64d": lambda: Stage(transforms.b64d, 4, strip=True),
+    "b32e": lambda: Stage(transforms.b32e, 5),
+    "b32d": lambda: Stage(transforms.b32d, 8, strip=True),
+    "hexe": lambda: Stage(transforms.hexe),
+    "hexd": lambda: Stage(transforms.hexd, 2, strip=True),
+    "bine": lambda: Stage(transforms.bine),
+    "bind": lambda: GroupDecode(transforms.bind, 8),
+    "bine7": lambda: Stage(lambda data: transforms.bine(data, 7)),
+    "bind7": lambda: GroupDecode(lambda data: transforms.bind(data, 7), 7),
+    "octe": lambda: NumberEncode(transforms.octe),
+    "octd": lambda: GroupDecode(transforms.octd, block=None),
+    "dece": lambda: NumberEncode(transforms.dece),
+    "decd": lambda: GroupDecode(transforms.decd, block=None),
+    "urle": lambda: Stage(transforms.urle),
+    "urld": UrlDecode,
+    "rot13": lambda: Stage(transforms.rot13),
+    "rot47": lambda: Stage(transforms.rot47),
+    "reverse": lambda: Whole(transforms.reverse),
+}
+
+aliases = {
+    "hex": "hexe",
+    "unhex": "hexd",
+    "rev": "reverse",
+}
+
+
+def parse(text):
+    """
+    Split "b64d | urld | rot13 | hex <input>" into its stage names and input.
+    """
+    valid = ", ".join([*stages, *aliases])
+    names = []
+    pos = 0
+    while True:
+        match = step_re.match(text, pos)
+        name = match and aliases.get(match.group(1).lower(), match.group(1).lower())
+        if name not in stages:
+            if names:
+                # Whatever follows a | has to be a stage, not the input
+                rest = text[pos:].split(maxsplit=1)
+                if not rest:
+                    raise ValueError(f"Missing a stage after |, stages are {valid}")
+                unknown = match.group(1) if match else rest[0]
+                raise ValueError(f"Unknown stage {unknown!r} after |, stages are {valid}")
+            break
+        names.append(name)
+        pos = match.end()
+        if not match.group(2):
+            break
+    if not names:
+        raise ValueError(f"Stages are {valid}")
+    return names, text[pos:].strip()
+
+
+class Pipeline:
+    """
+    A chain of stages, input is fed through every one of them in chunks.
+    """
+
+    def __init__(self, names):
+        self.stages = [stages[name]() for name in names]
+
+    def feed(self, data):
+        for stage in self.stages:
+            data = stage.feed(data)
+        return data
+
+    def flush(self):
+        data = b""
+        for stage in self.stages:
+            data = stage.feed(data) + stage.flush()
+        return data
+
+    def run(self, data):
+        return self.feed(data) + self.flush()
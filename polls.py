@@ -0,0 +1,51 @@
+from storage import load_json, save_json
+
+
+class PollIndex:
+    """
+    Index of the polls created by /poll and their live vote tallies.
+    Reactions on messages that aren't in here can be ignored without asking
+    discord about the message. The index is saved to `path` so it survives
+    restarts, the oldest polls are forgotten past `max_polls`.
+    """
+
+    def __init__(self, path, *, max_polls=1000):
+        self.path = path
+        self.max_polls = max_polls
+        self.polls = {int(k): v for k, v in load_json(path, {}).items()}
+        self._dirty = False
+
+    def __contains__(self, message_id):
+        return message_id in self.polls
+
+    def get(self, message_id):
+        return self.polls.get(message_id)
+
+    def add(self, message, title, options):
+        """
+        `options` maps the poll's emojis to the option they stand for.
+        """
+        self.polls[message.id] = {
+            "channel_id": message.channel.id,
+            "title": title,
+            "options": options,
+            "votes": {emoji: 0 for emoji in options},
+        }
+        while len(self.polls) > self.max_polls:
+            # Message ids grow with time, the smallest is the oldest poll
+            del self.polls[min(self.polls)]
+        self._dirty = True
+        self.save()
+
+    def vote(self, message_id, emoji, delta=1):
+        poll = self.polls.get(message_id)
+        if poll is None or emoji not in poll["votes"]:
+            return False
+        poll["votes"][emoji] = max(0, poll["votes"][emoji] + delta)
+        self._dirty = True
+        return True
+
+    def save(self):
+        if self._dirty:
+            save_json(self.path, self.polls)
+            self._dirty = False
@@ -0,0 +1,9 @@
+"""
+Starts the bot.
+Worker processes import the script the bot was started from, so this one
+only imports main.py (and everything it sets up) when it's run itself.
+"""
+if __name__ == "__main__":
+    import main
+
+    main.main()
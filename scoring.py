@@ -0,0 +1,50 @@
+import numpy as np
+
+# Relative frequency of a-z in English text
+english_freq = np.array([
+    8.167, 1.492, 2.782, 4.253, 12.702, 2.228, 2.015, 6.094, 6.966, 0.153,
+    0.772, 4.025, 2.406, 6.749, 7.507, 1.929, 0.095, 5.987, 6.327, 9.056,
+    2.758, 0.978, 2.360, 0.150, 1.974, 0.074,
+]) / 100
+
+# shift_index[k, j] is the ciphertext letter that decrypts to letter j with shift k
+shift_index = (np.arange(26)[None, :] + np.arange(26)[:, None]) % 26
+
+
+def to_bytes(text):
+    if isinstance(text, str):
+        return text.encode(errors="ignore")
+    return bytes(text)
+
+
+def letter_indices(text):
+    """
+    The letters of `text` as an array of 0-25, case folded, everything else dropped.
+    """
+    data = np.frombuffer(to_bytes(text), dtype=np.uint8) | 0x20
+    data = data[(data >= ord("a")) & (data <= ord("z"))]
+    return data - ord("a")
+
+
+def letter_counts(text):
+    return np.bincount(letter_indices(text), minlength=26)
+
+
+def chi_squared_shifts(counts):
+    """
+    Chi-squared distance from English of the decryption with every shift,
+    computed from the letter counts of the ciphertext alone. Lower is better.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    expected = english_freq * max(counts.sum(), 1)
+    observed = counts[shift_index]
+    return ((observed - expected) ** 2 / expected).sum(axis=-1)
+
+
+def rank_shifts(text, top=5):
+    """
+    The `top` most English looking Caesar shifts of `text` as (shift, score).
+    """
+    scores = chi_squared_shifts(letter_counts(text))
+    order = np.argsort(scores)[:top]
+    return [(int(shift), float(scores[shift])) for shift in order]
@@ -0,0 +1,25 @@
+import json
+import logging
+import os
+
+
+def load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError):
+        logging.exception(f"Couldn't load {path}")
+        return default
+
+
+def save_json(path, data):
+    """
+    Write `data` to a temporary file and rename it over `path`, so a crash
+    never leaves a half written file behind.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,178 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+youtube_id_re = re.compile(r"^[\w-]{11}$")
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def video_id_from_url(url):
+    """
+    The youtube video id of `url` or None, without any network call.
+    """
+    parsed = urlparse(url)
+    host = parsed.netloc.lower().removeprefix("www.").removeprefix("m.")
+    if host == "youtu.be":
+        video_id = parsed.path.strip("/")
+    elif host in ("youtube.com", "music.youtube.com"):
+        if parsed.path.startswith("/shorts/"):
+            video_id = parsed.path.split("/")[2]
+        else:
+            video_id = parse_qs(parsed.query).get("v", [""])[0]
+    else:
+        return None
+    return video_id if youtube_id_re.match(video_id) else None
+
+
+def stream_expiry(stream_url):
+    """
+    Unix time at which a googlevideo stream url stops working, if it says so.
+    """
+    parsed = urlparse(stream_url)
+    expire = parse_qs(parsed.query).get("expire")
+    if not expire:
+        # Some urls carry their parameters as path segments: /expire/1680000000/
+        match = re.search(r"/expire/(\d+)", parsed.path)
+        expire = [match.group(1)] if match else None
+    return float(expire[0]) if expire and expire[0].isdigit() else None
+
+
+class TrackCache:
+    """
+    On disk (SQLite) cache of search query -> video id -> track metadata.
+    Stream urls are kept alongside the metadata and only handed out while
+    their embedded expiry is further away than the track plays.
+    Least recently used tracks are evicted past `max_tracks`.
+    """
+
+    def __init__(self, path, *, max_tracks=5000, expiry_margin=120):
+        self.max_tracks = max_tracks
+        self.expiry_margin = expiry_margin
+        self.hits = 0
+        self.misses = 0
+        self.stream_hits = 0
+        self.stream_misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tracks (
+                video_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                stream_url TEXT,
+                expires REAL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tracks_last_used ON tracks (last_used);
+            CREATE TABLE IF NOT EXISTS queries (
+                query TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS queries_video_id ON queries (video_id);
+            """
+        )
+
+    def key(self, query):
+        video_id = video_id_from_url(query)
+        return (video_id, None) if video_id else (None, normalize_query(query))
+
+    def get(self, query):
+        """
+        The cached track for `query` or None. `stream_url` is None when the
+        cached one is missing or about to expire.
+        """
+        video_id, norm = self.key(query)
+        now = time.time()
+        with self._lock:
+            if video_id is None:
+                row = self._db.execute(
+                    "SELECT video_id FROM queries WHERE query = ?", (norm,)
+                ).fetchone()
+                video_id = row and row[0]
+            row = video_id and self._db.execute(
+                "SELECT data, stream_url, expires FROM tracks WHERE video_id = ?",
+                (video_id,),
+            ).fetchone()
+            if not row:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._db.execute(
+                "UPDATE tracks SET last_used = ? WHERE video_id = ?", (now, video_id)
+            )
+            self._db.commit()
+
+        data, stream_url, expires = row
+        track = json.loads(data)
+        track["stream_url"] = None
+        duration = track.get("duration") or 0
+        if stream_url and expires and expires > now + duration + self.expiry_margin:
+            self.stream_hits += 1
+            track["stream_url"] = stream_url
+        else:
+            self.stream_misses += 1
+        return track
+
+    def put(self, query, track):
+        video_id = track.get("id")
+        if not video_id:
+            return
+
+        _, norm = self.key(query)
+        stream_url = track.get("stream_url")
+        expires = stream_expiry(stream_url) if stream_url else None
+        data = json.dumps({k: v for k, v in track.items() if k != "stream_url"})
+        with self._lock:
+            if stream_url is None:
+                # Keep a still valid stream url of an earlier extraction
+                self._db.execute(
+                    """INSERT INTO tracks (video_id, data, last_used) VALUES (?, ?, ?)
+                    ON CONFLICT (video_id) DO UPDATE SET
+                    data = excluded.data, last_used = excluded.last_used""",
+                    (video_id, data, time.time()),
+                )
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?)",
+                    (video_id, data, stream_url, expires, time.time()),
+                )
+            if norm is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO queries VALUES (?, ?)", (norm, video_id)
+                )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()
+        if count <= self.max_tracks:
+            return
+        self._db.execute(
+            """DELETE FROM tracks WHERE video_id IN (
+            SELECT video_id FROM tracks ORDER BY last_used LIMIT ?)""",
+            (count - self.max_tracks,),
+        )
+        self._db.execute(
+            "DELETE FROM queries WHERE video_id NOT IN (SELECT video_id FROM tracks)"
+        )
+
+    def stats(self):
+        with self._lock:
+            (tracks,) = self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()
+            (queries,) = self._db.execute("SELECT COUNT(*) FROM queries").fetchone()
+        return {
+            "tracks": tracks,
+            "queries": queries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stream_hits": self.stream_hits,
+            "stream_misses": self.stream_misses,
+        }
@@ -0,0 +1,100 @@
+"""
+Byte to byte codecs behind the encoding commands, shared by /magic.
+"""
+import base64
+import binascii
+import re
+from urllib.parse import quote_from_bytes, unquote_to_bytes
+
+import bits
+from ciphers import Rot13, Rot47
+
+whitespace_re = re.compile(rb"\s+")
+
+
+def b64e(data):
+    return base64.b64encode(data)
+
+
+def b64d(data):
+    data = whitespace_re.sub(b"", data)
+    # Be lenient about missing padding
+    return base64.b64decode(data + b"=" * (-len(data) % 4), validate=True)
+
+
+def b32e(data):
+    return base64.b32encode(data)
+
+
+def b32d(data):
+    data = whitespace_re.sub(b"", data).upper()
+    return base64.b32decode(data + b"=" * (-len(data) % 8))
+
+
+def hexe(data):
+    return binascii.hexlify(data)
+
+
+def hexd(data):
+    data = whitespace_re.sub(b"", data)
+    if data.startswith(b"0x"):
+        data = data[2:]
+    return bytes.fromhex(data.decode("ascii"))
+
+
+def bine(data, width=8):
+    return bits.encode(data, width)
+
+
+def bind(data, width=8):
+    return bits.decode(data, width)
+
+
+def octe(data):
+    return bits.encode_numbers(data, 8)
+
+
+def octd(data):
+    return bits.decode_numbers(data, 8)
+
+
+def dece(data):
+    return bits.encode_numbers(data, 10)
+
+
+def decd(data):
+    return bits.decode_numbers(data, 10)
+
+
+def urle(data):
+    return quote_from_bytes(data).encode()
+
+
+def urld(data):
+    return unquote_to_bytes(data)
+
+
+def rot13(data):
+    return Rot13.encrypt(data)
+
+
+def rot47(data):
+    return Rot47.encrypt(data)
+
+
+def reverse(data):
+    return data[::-1]
+
+
+# Decoders /magic searches over
+decoders = {
+    "base64": b64d,
+    "base32": b32d,
+    "hex": hexd,
+    "binary": bind,
+    "octal": octd,
+    "decimal": decd,
+    "url": urld,
+    "rot13": rot13,
+    "rot47": rot47,
+}
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from collections import deque
+
+token_url = "https://opentdb.com/api_token.php"
+
+# opentdb response codes
+SUCCESS = 0
+NO_RESULTS = 1
+TOKEN_NOT_FOUND = 3
+TOKEN_EMPTY = 4
+RATE_LIMITED = 5
+
+
+class QuestionBuffer:
+    """
+    Prefetch buffer of opentdb questions.
+    Questions are pulled `batch_size` at a time with a session token, so
+    opentdb never hands out the same question twice, and refilled in the
+    background once fewer than `low_water` are left.
+    """
+
+    def __init__(self, http_client, url, *, batch_size=50, low_water=10, params=None):
+        self.http_client = http_client
+        self.url = url
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.params = params or {}
+
+        self.questions = deque()
+        self.token = None
+        self._refill_task = None
+
+    def __len__(self):
+        return len(self.questions)
+
+    async def get(self):
+        if not self.questions:
+            await self.refill_soon()
+        if not self.questions:
+            raise LookupError("No quiz questions available")
+
+        question = self.questions.popleft()
+        if len(self.questions) < self.low_water:
+            self.refill_soon()
+        return question
+
+    def refill_soon(self):
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self.refill())
+        return self._refill_task
+
+    async def refill(self):
+        try:
+            await self._refill()
+        except Exception:
+            logging.exception("Refilling the quiz buffer failed")
+
+    async def _refill(self):
+        # A couple of attempts is enough to get past an expired/exhausted token
+        for _ in range(3):
+            if self.token is None:
+                self.token = await self._request_token()
+
+            params = {**self.params, "amount": self.batch_size, "token": self.token}
+            data = await self.http_client.get_json(self.url, params=params)
+            code = data.get("response_code")
+
+            if code == SUCCESS:
+                self.questions.extend(data.get("results", []))
+                return
+            elif code == TOKEN_NOT_FOUND:
+                self.token = None
+            elif code in (TOKEN_EMPTY, NO_RESULTS):
+                # Every question was seen (or less than a batch is left), start over
+                await self._reset_token()
+            elif code == RATE_LIMITED:
+                await asyncio.sleep(5)
+            else:
+                raise ValueError(f"opentdb returned response code {code}")
+
+    async def _request_token(self):
+        data = await self.http_client.get_json(token_url, params={"command": "request"})
+        return data.get("token")
+
+    async def _reset_token(self):
+        await self.http_client.get_json(
+            token_url, params={"command": "reset", "token": self.token}
+        )
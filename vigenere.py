@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+
+from scoring import chi_squared_shifts, letter_indices, to_bytes
+
+english_ioc = 0.0667
+# Kasiski examination only looks at this many letters, repeats show up early
+kasiski_letters = 50_000
+
+
+def column_counts(letters, key_length):
+    """
+    Letter counts of every column of `letters` written in rows of `key_length`.
+    """
+    columns = np.arange(len(letters)) % key_length
+    counts = np.bincount(columns * 26 + letters, minlength=key_length * 26)
+    return counts.reshape(key_length, 26)
+
+
+def index_of_coincidence(letters, key_length):
+    counts = column_counts(letters, key_length).astype(np.float64)
+    totals = counts.sum(axis=1)
+    totals = np.maximum(totals * (totals - 1), 1)
+    return float(((counts * (counts - 1)).sum(axis=1) / totals).mean())
+
+
+def kasiski(letters, max_key_length):
+    """
+    For every key length, the fraction of distances between repeated
+    trigrams it divides.
+    """
+    letters = letters[:kasiski_letters].astype(np.int64)
+    votes = np.zeros(max_key_length + 1)
+    if len(letters) < 3:
+        return votes
+
+    trigrams = letters[:-2] * 676 + letters[1:-1] * 26 + letters[2:]
+    order = np.argsort(trigrams, kind="stable")
+    repeated = trigrams[order][1:] == trigrams[order][:-1]
+    distances = (order[1:] - order[:-1])[repeated]
+    if len(distances):
+        lengths = np.arange(2, max_key_length + 1)
+        votes[2:] = (distances[:, None] % lengths == 0).mean(axis=0)
+    return votes
+
+
+def solve_key(letters, key_length):
+    counts = column_counts(letters, key_length)
+    return [int(np.argmin(chi_squared_shifts(column))) for column in counts]
+
+
+def shortest_period(key):
+    """
+    "abcabc" -> "abc", a key found for a multiple of the real length.
+    """
+    for period in range(1, len(key)):
+        if len(key) % period == 0 and key == key[:period] * (len(key) // period):
+            return key[:period]
+    return key
+
+
+def decrypt(text, key):
+    """
+    Vigenère decrypt `text` with a list of shifts, leaving non letters alone.
+    The key only advances on letters.
+    """
+    data = np.frombuffer(to_bytes(text), dtype=np.uint8).copy()
+    folded = data | 0x20
+    is_letter = (folded >= ord("a")) & (folded <= ord("z"))
+    base = np.where(data >= ord("a"), ord("a"), ord("A"))[is_letter]
+
+    shifts = np.asarray(key, dtype=np.int64)[np.arange(is_letter.sum()) % len(key)]
+    data[is_letter] = (data[is_letter] - base - shifts) % 26 + base
+    return data.tobytes().decode(errors="replace")
+
+
+def key_to_str(key):
+    return "".join(chr(ord("A") + shift) for shift in key)
+
+
+def crack(text, max_key_length=20, cpu_budget=5.0, candidates=3):
+    """
+    Estimate the key length with the index of coincidence and Kasiski
+    examination, then solve every column as a Caesar cipher.
+    Returns up to `candidates` (key, index of coincidence) pairs, best first.
+    Stops trying key lengths once `cpu_budget` seconds of CPU time are used.
+    """
+    deadline = time.process_time() + cpu_budget
+    letters = letter_indices(text).astype(np.int64)
+    if len(letters) < 2:
+        return []
+    max_key_length = max(1, min(max_key_length, len(letters) // 2))
+
+    iocs = np.zeros(max_key_length + 1)
+    for key_length in range(1, max_key_length + 1):
+        iocs[key_length] = index_of_coincidence(letters, key_length)
+        if time.process_time() > deadline:
+            break
+    votes = kasiski(letters, max_key_length)
+
+    # The right length (and its multiples) lifts the IoC from random text
+    # (~0.038) towards English, Kasiski breaks ties between similar lengths
+    likeness = iocs / english_ioc + 0.25 * votes
+    likeness[iocs == 0] = -np.inf
+    # A multiple of a length with about the same IoC adds nothing but
+    # overfitting. Kasiski stays out of this, a divisor always gets at least
+    # the votes of its multiples, and a key with a repeat in it ("ABCABD")
+    # has a divisor that comes close without being right.
+    for key_length in range(max_key_length, 1, -1):
+        for divisor in range(1, key_length):
+            if key_length % divisor == 0 and iocs[divisor] >= 0.95 * iocs[key_length]:
+                likeness[key_length] = -np.inf
+                break
+
+    results = {}
+    for key_length in np.argsort(likeness)[::-1][:candidates]:
+        if not np.isfinite(likeness[key_length]) or time.process_time() > deadline:
+            break
+        key = shortest_period(key_to_str(solve_key(letters, int(key_length))))
+        results.setdefault(key, float(iocs[key_length]))
+    return list(results.items())
@@ -0,0 +1,40 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+max_workers = int(os.environ.get("WORKER_PROCESSES", os.cpu_count() or 2))
+
+# Modules the jobs live in, imported once by the fork server instead of by
+# every worker
+preload = ["analysis", "hashcrack", "magic", "vigenere", "xor"]
+
+_pool = None
+
+
+def process_pool():
+    """
+    Shared pool of worker processes for CPU heavy commands.
+    Created on first use, workers are started as jobs come in.
+    Workers come from a fork server, forking the bot itself would copy
+    locks held by its other threads. They import the script the bot was
+    started from, which is why it's started from run.py and not main.py.
+    """
+    global _pool
+    if _pool is None:
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(preload)
+        _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+    return _pool
+
+
+async def run_in_process(func, *args, timeout=None):
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        loop.run_in_executor(process_pool(), func, *args), timeout
+    )
+
+
+def shutdown_workers():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,148 @@
+import base64
+import binascii
+import re
+import string
+
+import numpy as np
+
+from scoring import english_freq
+
+hex_re = re.compile(r"^[0-9a-fA-F]+$")
+
+
+def parse_blob(text, guess=True):
+    """
+    Bytes from `text` and what it was read as: "hex" with a 0x or hex:
+    prefix, "base64" with a b64: prefix and "text" otherwise. Without a
+    prefix hex and then base64 are tried first if `guess` is set, fine for
+    ciphertext but not for keys, where "test" would decode as base64.
+    """
+    if isinstance(text, (bytes, bytearray)):
+        return bytes(text), "raw"
+    stripped = "".join(text.split())
+    for prefix in ("0x", "hex:"):
+        if stripped.lower().startswith(prefix):
+            return bytes.fromhex(stripped[len(prefix):]), "hex"
+    if stripped.lower().startswith("b64:"):
+        return base64.b64decode(stripped[4:], validate=True), "base64"
+    if not guess:
+        return text.encode(), "text"
+
+    if hex_re.match(stripped) and len(stripped) % 2 == 0:
+        return bytes.fromhex(stripped), "hex"
+    try:
+        return base64.b64decode(stripped, validate=True), "base64"
+    except (binascii.Error, ValueError):
+        return text.encode(), "text"
+
+
+def _byte_weights():
+    """
+    How English-like every byte value is: letter frequencies for letters,
+    a high weight for space, a little for other printable text and a
+    penalty for everything else.
+    """
+    weights = np.full(256, -0.05)
+    for char in string.printable:
+        weights[ord(char)] = 0.005
+    weights[ord(" ")] = 0.13
+    for i, freq in enumerate(english_freq):
+        weights[ord("a") + i] = freq
+        weights[ord("A") + i] = freq * 0.5
+    return weights
+
+
+byte_weights = _byte_weights()
+printable = np.zeros(256, dtype=bool)
+printable[[ord(c) for c in string.printable]] = True
+# key_weights[k, b] is the weight of byte b once xored with key k
+key_weights = byte_weights[np.arange(256)[:, None] ^ np.arange(256)[None, :]]
+
+
+def to_array(data):
+    return np.frombuffer(bytes(data), dtype=np.uint8)
+
+
+def xor(data, key):
+    data = to_array(data)
+    key = to_array(key)
+    if not len(key):
+        raise ValueError("The key can't be empty")
+    if len(key) == 1:
+        return (data ^ key[0]).tobytes()
+    # Tiling copies the key in whole blocks, np.resize goes byte by byte
+    stream = np.tile(key, -(-len(data) // len(key)))[: len(data)]
+    return (data ^ stream).tobytes()
+
+
+def single_byte_scores(data):
+    """
+    English score of `data` xored with each of the 256 keys. Xoring only
+    permutes the byte histogram, so all keys are scored from one histogram.
+    """
+    counts = np.bincount(to_array(data), minlength=256)
+    return key_weights @ counts / max(len(data), 1)
+
+
+def crack_single(data, top=5):
+    """
+    The `top` single byte keys as (key, score, printable ratio), best first.
+    """
+    scores = single_byte_scores(data)
+    counts = np.bincount(to_array(data), minlength=256)
+    results = []
+    for key in np.argsort(scores)[::-1][:top]:
+        ratio = counts[np.arange(256)[printable] ^ key].sum() / max(len(data), 1)
+        results.append((int(key), float(scores[key]), float(ratio)))
+    return results
+
+
+def keysize_distances(data, max_keysize=40, blocks=8):
+    """
+    Mean Hamming distance per bit between the first `blocks` blocks of every
+    key size. The right key size lines up plaintext with plaintext and gives
+    the smallest distance.
+    """
+    data = to_array(data)
+    distances = {}
+    for keysize in range(1, max_keysize + 1):
+        count = min(blocks, len(data) // keysize)
+        if count < 2:
+            break
+        rows = data[: keysize * count].reshape(count, keysize)
+        pairs = rows[:, None, :] ^ rows[None, :, :]
+        bits = np.unpackbits(pairs, axis=-1).sum() / 2
+        distances[keysize] = bits / (keysize * 8 * count * (count - 1) / 2)
+    return distances
+
+
+def solve_repeating(data, keysize):
+    """
+    Best key of `keysize` bytes, every column solved as a single byte xor.
+    """
+    data = to_array(data)
+    columns = np.arange(len(data)) % keysize
+    counts = np.bincount(columns * 256 + data, minlength=keysize * 256)
+    scores = counts.reshape(keysize, 256) @ key_weights.T
+    return bytes(np.argmax(scores, axis=1).astype(np.uint8))
+
+
+def crack_repeating(data, max_keysize=40, candidates=3):
+    """
+    The most likely repeating keys as (key, score), best first.
+    """
+    distances = keysize_distances(data, max_keysize)
+    keysizes = sorted(distances, key=distances.get)[: candidates * 2]
+
+    results = {}
+    for keysize in keysizes:
+        key = solve_repeating(data, keysize)
+        # A key found for a multiple of the real size repeats itself
+        for period in range(1, keysize):
+            if keysize % period == 0 and key == key[:period] * (keysize // period):
+                key = key[:period]
+                break
+        if key not in results:
+            plain = to_array(xor(data, key))
+            results[key] = float(byte_weights[plain].mean()) if len(plain) else 0.0
+    return sorted(results.items(), key=lambda result: result[1], reverse=True)[:candidates]